@@ -0,0 +1,113 @@
+"""
+Client for OpenAI-compatible batch APIs: many chat completion requests are written to one
+JSONL file, uploaded, processed by the provider within the completion window and
+downloaded as one output file. Batches cost less than interactive requests and do not
+count against the per-minute rate limits.
+
+Requests are plain HTTP (requests), so the client works against the real API and against
+the local stand-in in batch_standin.py:
+
+    client = BatchClient("http://127.0.0.1:8091/v1")
+    batch = client.submit([{"custom_id": "1", "body": {"model": ..., "messages": [...]}}])
+    batch = client.wait([batch["id"]])[batch["id"]]
+    for custom_id, (answer, error) in client.results(batch).items():
+        ...
+"""
+import json
+import os
+import time
+
+import requests
+
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchError(Exception):
+    pass
+
+
+class BatchClient:
+    def __init__(self, base_url=None, api_key=None, endpoint="/v1/chat/completions",
+                 completion_window="24h", timeout=60):
+        self.base_url = (base_url or os.getenv("OPENAI_BASE_URL") or "https://api.openai.com/v1").rstrip("/")
+        self.endpoint = endpoint
+        self.completion_window = completion_window
+        self.timeout = timeout
+        self.session = requests.Session()
+        api_key = api_key or os.getenv("OPENAI_API_KEY")
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def _request(self, method, path, **kwargs):
+        response = self.session.request(method, f"{self.base_url}{path}", timeout=self.timeout, **kwargs)
+        if response.status_code >= 400:
+            raise BatchError(f"{method} {path} failed with HTTP {response.status_code}: {response.text[:200]}")
+        return response
+
+    def upload(self, name, data):
+        """Upload a batch input file; returns its file ID"""
+        response = self._request("POST", "/files", data={"purpose": "batch"},
+                                 files={"file": (name, data, "application/jsonl")})
+        return response.json()["id"]
+
+    def create(self, input_file_id, metadata=None):
+        body = {"input_file_id": input_file_id, "endpoint": self.endpoint, "completion_window": self.completion_window}
+        if metadata:
+            body["metadata"] = metadata
+        return self._request("POST", "/batches", json=body).json()
+
+    def retrieve(self, batch_id):
+        return self._request("GET", f"/batches/{batch_id}").json()
+
+    def content(self, file_id):
+        return self._request("GET", f"/files/{file_id}/content").text
+
+    def submit(self, batch_requests, name="batch.jsonl", metadata=None):
+        """Write requests ({"custom_id", "body"}) as a JSONL input file, upload it and create the batch"""
+        lines = [
+            json.dumps({"custom_id": r["custom_id"], "method": "POST", "url": self.endpoint, "body": r["body"]},
+                       ensure_ascii=False, separators=(",", ":"))
+            for r in batch_requests
+        ]
+        file_id = self.upload(name, ("\n".join(lines) + "\n").encode("utf-8"))
+        return self.create(file_id, metadata)
+
+    def wait(self, batch_ids, poll_interval=30, timeout=None, on_update=None):
+        """Poll until all batches have finished; returns {batch_id: batch}"""
+        deadline = time.time() + timeout if timeout else None
+        finished = {}
+        while True:
+            for batch_id in batch_ids:
+                if batch_id in finished:
+                    continue
+                batch = self.retrieve(batch_id)
+                if on_update:
+                    on_update(batch)
+                if batch["status"] in TERMINAL_STATUSES:
+                    finished[batch_id] = batch
+            if len(finished) == len(batch_ids):
+                return finished
+            if deadline and time.time() > deadline:
+                raise BatchError(f"{len(batch_ids) - len(finished)} batch(es) not finished after {timeout} s")
+            time.sleep(poll_interval)
+
+    def results(self, batch):
+        """{custom_id: (answer, error)} of a finished batch; requests without output get an error"""
+        results = {}
+        for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+            if not file_id:
+                continue
+            for line in self.content(file_id).splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record.get("response") or {}
+                if record.get("error"):
+                    results[record["custom_id"]] = (None, record["error"].get("message", str(record["error"])))
+                elif response.get("status_code", 200) >= 400:
+                    error = (response.get("body") or {}).get("error") or {}
+                    results[record["custom_id"]] = (None, f"HTTP {response['status_code']}: {error.get('message', '')}")
+                else:
+                    message = response["body"]["choices"][0]["message"]
+                    results[record["custom_id"]] = ((message.get("content") or "").strip(), None)
+        return results
@@ -0,0 +1,235 @@
+"""
+Local stand-in for an OpenAI-compatible batch API, for testing and benchmarking the batch
+mode of benchmark.py offline.
+
+Supports uploading input files (POST /v1/files), creating and retrieving batches
+(POST /v1/batches, GET /v1/batches/<id>) and downloading output files
+(GET /v1/files/<id>/content). A batch is processed on a background thread after an
+artificial delay; every request is answered with one of the options listed in its prompt
+(picked at random), and a share of requests can fail to exercise the error file.
+
+    python batch_standin.py --port 8091 --delay 5 --fail-rate 0.05
+    python benchmark.py --batch --batch-url http://127.0.0.1:8091/v1
+"""
+import argparse
+import email.parser
+import email.policy
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+class BatchStandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body, content_type="application/json"):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status, message):
+        self._reply(status, {"error": {"message": message}})
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _authorized(self):
+        with self.server.lock:
+            self.server.stats["requests"] += 1
+        if self.server.api_key and self.headers.get("Authorization") != f"Bearer {self.server.api_key}":
+            self._read_body()
+            self._error(401, "Invalid API key")
+            return False
+        return True
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        path = urlparse(self.path).path
+        body = self._read_body()
+
+        if path == "/v1/files":
+            # multipart/form-data with the fields purpose and file
+            message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+                f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode("latin-1") + body)
+            upload = next((part for part in message.iter_parts() if part.get_filename()), None)
+            if upload is None:
+                self._error(400, "No file in upload")
+                return
+            file_id = f"file-{uuid.uuid4().hex[:24]}"
+            self.server.add_file(file_id, upload.get_filename(), upload.get_payload(decode=True))
+            self._reply(200, {"id": file_id, "object": "file", "purpose": "batch", "filename": upload.get_filename()})
+        elif path == "/v1/batches":
+            request = json.loads(body or b"{}")
+            if request.get("input_file_id") not in self.server.files:
+                self._error(404, "Input file not found")
+                return
+            self._reply(200, self.server.create_batch(request))
+        else:
+            self._error(404, "Not found")
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        path = urlparse(self.path).path
+
+        match = re.fullmatch(r"/v1/batches/([\w-]+)", path)
+        if match:
+            with self.server.lock:
+                batch = self.server.batches.get(match.group(1))
+                batch = dict(batch) if batch else None
+            if batch is None:
+                self._error(404, "Batch not found")
+            else:
+                self._reply(200, batch)
+            return
+
+        match = re.fullmatch(r"/v1/files/([\w-]+)/content", path)
+        if match:
+            with self.server.lock:
+                entry = self.server.files.get(match.group(1))
+            if entry is None:
+                self._error(404, "File not found")
+            else:
+                self._reply(200, entry["data"], "application/jsonl")
+            return
+
+        self._error(404, "Not found")
+
+
+class BatchStandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, api_key=None, delay=2.0, fail_rate=0.0):
+        super().__init__(address, BatchStandInHandler)
+        self.api_key = api_key
+        self.delay = delay
+        self.fail_rate = fail_rate
+        self.files = {}
+        self.batches = {}
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "batches": 0, "batch_requests": 0}
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def add_file(self, file_id, filename, data):
+        with self.lock:
+            self.files[file_id] = {"filename": filename, "data": data}
+
+    def create_batch(self, request):
+        batch_id = f"batch_{uuid.uuid4().hex[:24]}"
+        batch = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": request.get("endpoint"),
+            "input_file_id": request["input_file_id"],
+            "completion_window": request.get("completion_window", "24h"),
+            "status": "validating",
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": int(time.time()),
+            "completed_at": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            "metadata": request.get("metadata")
+        }
+        with self.lock:
+            self.batches[batch_id] = batch
+            self.stats["batches"] += 1
+        threading.Thread(target=self.process, args=(batch_id,), daemon=True).start()
+        return dict(batch)
+
+    def answer(self, body):
+        """One of the options listed in the prompt ("Available options: ..."), or a fixed text"""
+        texts = []
+        for message in body.get("messages", []):
+            content = message.get("content")
+            if isinstance(content, str):
+                texts.append(content)
+            else:
+                texts.extend(part.get("text", "") for part in content or [] if part.get("type") == "text")
+        match = re.search(r"Available options: (.*)", "\n".join(texts))
+        options = [x.strip() for x in match.group(1).split(",")] if match else []
+        return random.choice(options) if options else "42"
+
+    def process(self, batch_id):
+        with self.lock:
+            batch = self.batches[batch_id]
+            lines = self.files[batch["input_file_id"]]["data"].decode("utf-8").splitlines()
+            batch["status"] = "in_progress"
+            batch["request_counts"]["total"] = len(lines)
+
+        time.sleep(self.delay)
+
+        output, errors = [], []
+        for line in lines:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            request_id = f"req_{uuid.uuid4().hex[:24]}"
+            if self.fail_rate and random.random() < self.fail_rate:
+                errors.append({"id": request_id, "custom_id": request["custom_id"], "response": {
+                    "status_code": 500, "body": {"error": {"message": "injected failure"}}}, "error": None})
+                continue
+            body = request["body"]
+            output.append({"id": request_id, "custom_id": request["custom_id"], "error": None, "response": {
+                "status_code": 200,
+                "body": {
+                    "object": "chat.completion",
+                    "model": body.get("model"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": self.answer(body)},
+                                 "finish_reason": "stop"}]
+                }
+            }})
+
+        def jsonl(records):
+            return "".join(json.dumps(record) + "\n" for record in records).encode("utf-8")
+
+        with self.lock:
+            if output:
+                batch["output_file_id"] = f"file-{uuid.uuid4().hex[:24]}"
+                self.files[batch["output_file_id"]] = {"filename": "output.jsonl", "data": jsonl(output)}
+            if errors:
+                batch["error_file_id"] = f"file-{uuid.uuid4().hex[:24]}"
+                self.files[batch["error_file_id"]] = {"filename": "errors.jsonl", "data": jsonl(errors)}
+            batch["request_counts"].update(completed=len(output), failed=len(errors))
+            batch["status"] = "completed"
+            batch["completed_at"] = int(time.time())
+            self.stats["batch_requests"] += len(output) + len(errors)
+
+
+def start_standin(port=0, **kwargs):
+    """Start a stand-in server on a background thread; returns the server (server.url, server.stats, ...)"""
+    server = BatchStandInServer(("127.0.0.1", port), **kwargs)
+    threading.Thread(target=server.serve_forever, name="batch-standin", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in batch API server")
+    parser.add_argument("--port", type=int, default=8091)
+    parser.add_argument("--api-key", help="require this bearer token")
+    parser.add_argument("--delay", type=float, default=2.0, help="seconds until a batch is completed")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of requests that fail")
+    args = parser.parse_args()
+
+    server = BatchStandInServer(("127.0.0.1", args.port), args.api_key, args.delay, args.fail_rate)
+    print(f"Batch API stand-in listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
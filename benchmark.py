@@ -1,19 +1,29 @@
+import argparse
+import asyncio
 import csv
+import io
 import os
+import random
 import time
 import json
-import base64
-from openai import OpenAI
 from dotenv import load_dotenv
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 from openpyxl import Workbook
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from records import Task
+from llm_backend import InlineImage, create_provider, openai_options, openai_parts, rate_limit_retry_after
+from response_cache import ResponseCache, request_key
+from journal import Journal
+from batch_api import BatchClient
 
 # Load environment variables
 load_dotenv()
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+# BENCHMARK_PROVIDER=fake runs the benchmark offline
+provider = create_provider(os.getenv('BENCHMARK_PROVIDER', 'openai'))
 
 # Configuration
+SYSTEM_PROMPT = "You are a math problem solver. Provide only the answer, no explanation."
+
 MODELS = [
     "gpt-4o-mini",
     "gpt-4o",
@@ -27,9 +37,90 @@ MODELS = [
     "o4-mini",
 ]
 
+# Rate limits in requests per minute per model (adjust to the account's usage tier)
+DEFAULT_REQUESTS_PER_MINUTE = 500
+MODEL_REQUESTS_PER_MINUTE = {}
+
+# Requests answered with 429 are retried after Retry-After or, without it, after an
+# exponential backoff with jitter
+RATE_LIMIT_RETRIES = 6
+RATE_LIMIT_BACKOFF_BASE = 1
+RATE_LIMIT_BACKOFF_MAX = 60
+
+# Answers are cached on disk and reused for this long (--refresh queries everything again)
+RESPONSE_CACHE_PATH = "benchmark_cache.sqlite"
+RESPONSE_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60
+
+# Every finished task result is appended to benchmark_runs/<run id>/ (see --resume)
+BENCHMARK_RUNS_DIR = "benchmark_runs"
+
+# Batch mode (--batch): requests per batch file and seconds between status checks
+BATCH_MAX_REQUESTS = 50000
+BATCH_POLL_SECONDS = 30
+
+# JPEG quality when images are downscaled with --max-image-size (needs Pillow)
+IMAGE_QUALITY = 85
+
+def request_bytes(content):
+    """Approximate payload size of a request: prompt text plus base64-encoded images"""
+    size = 0
+    for item in content:
+        if isinstance(item, InlineImage):
+            size += len(item.data_url())
+        else:
+            size += len(item.encode("utf-8"))
+    return size
+
+def downscale_image(data, max_size, quality=IMAGE_QUALITY):
+    """JPEG bytes scaled down to at most max_size pixels per side (the original if that is not smaller)"""
+    from PIL import Image
+    
+    with Image.open(io.BytesIO(data)) as image:
+        image.thumbnail((max_size, max_size))
+        output = io.BytesIO()
+        image.convert("RGB").save(output, "JPEG", quality=quality, optimize=True)
+    scaled = output.getvalue()
+    return scaled if len(scaled) < len(data) else data
+
+class ModelLimiter:
+    """Token bucket and concurrency limit of one model; a 429 pauses all requests of the model"""
+    def __init__(self, requests_per_minute, max_concurrency):
+        self.rate = requests_per_minute / 60
+        self.capacity = max(1.0, min(self.rate, max_concurrency))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.lock = asyncio.Lock()
+    
+    async def acquire(self):
+        """Wait for a free slot and a token (release the slot with self.slots.release())"""
+        await self.slots.acquire()
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+    
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
 class Benchmark:
-    def __init__(self, tasks_csv="data/tasks.csv"):
+    def __init__(self, tasks_csv="data/tasks.csv", cache=None, refresh=False, max_image_size=None):
         self.tasks_csv = tasks_csv
+        self.max_image_size = max_image_size  # Downscale images to this many pixels per side
+        self.images = {}        # image_path -> InlineImage, read and encoded once
+        self.cache = cache      # ResponseCache or None
+        self.refresh = refresh  # Ignore cached answers (new answers are still stored)
+        self.journal = None     # Journal of the current run
+        self.completed = {}     # (model, task index) -> result already in the journal
         self.results = []
         self.tasks = self.load_tasks()
     
@@ -39,147 +130,375 @@ class Benchmark:
         with open(self.tasks_csv, "r", encoding="utf-8") as f:
             reader = csv.DictReader(f, delimiter=";")
             for row in reader:
-                task = {
-                    "question": row["question"].strip(),
-                    "options": [x.strip() for x in row["options"].split(";")],
-                    "correct_solution": row["correct_solution"].strip(),
-                    "image_path": row.get("image_path", "").strip()
-                }
-                if task["correct_solution"] not in task["options"]:
-                    task["options"].append(task["correct_solution"])
+                task = Task(
+                    question=row["question"].strip(),
+                    options=[x.strip() for x in row["options"].split(";")],
+                    correct_solution=row["correct_solution"].strip(),
+                    image_path=row.get("image_path", "").strip()
+                )
+                if task.correct_solution not in task.options:
+                    task.options.append(task.correct_solution)
                 tasks.append(task)
+        
+        self.load_images(tasks)
         return tasks
     
-    def run_task(self, model, task):
-        """Run a single task with the specified model"""
-        start_time = time.time()
+    def load_images(self, tasks):
+        """Read (and optionally downscale) every task image once and encode it for all models"""
+        original_bytes = 0
+        for task in tasks:
+            if not task.image_path or task.image_path in self.images:
+                continue
+            img_path = os.path.join("static", "img", task.image_path + ".jpg")
+            if not os.path.exists(img_path):
+                continue
+            
+            with open(img_path, "rb") as img_file:
+                data = img_file.read()
+            original_bytes += len(data)
+            if self.max_image_size:
+                try:
+                    data = downscale_image(data, self.max_image_size)
+                except ImportError:
+                    print("Pillow is not installed; sending images at full size")
+                    self.max_image_size = None
+            
+            image = InlineImage(data, "image/jpeg")
+            image.data_url()
+            image.digest()
+            self.images[task.image_path] = image
         
+        if self.images:
+            sent_bytes = sum(len(image.data) for image in self.images.values())
+            print(f"Loaded {len(self.images)} images: {original_bytes / 1024:.0f} KB on disk, {sent_bytes / 1024:.0f} KB to send")
+    
+    def build_request(self, task):
+        """Message content for a task: the prompt and the image if available"""
         # Prepare text for prompt
-        prompt_text = f"Solve this math problem. Only provide the answer, no explanation or working: {task['question']}\n"
-        prompt_text += f"Available options: {', '.join(task['options'])}\n"
+        prompt_text = f"Solve this math problem. Only provide the answer, no explanation or working: {task.question}\n"
+        prompt_text += f"Available options: {', '.join(task.options)}\n"
         prompt_text += "Answer with just the correct option text."
         
         # Create content list starting with text
-        content = [{"type": "text", "text": prompt_text}]
-        
-        # Add image if available
-        if task.get("image_path"):
-            img_path = os.path.join("static", "img", task["image_path"] + ".jpg")
-            if os.path.exists(img_path):
-                with open(img_path, "rb") as img_file:
-                    # Convert image to base64
-                    base64_image = base64.b64encode(img_file.read()).decode('utf-8')
-                    
-                    # Add image to content
-                    content.append({
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64_image}"
-                        }
-                    })
+        content = [prompt_text]
+        
+        # Add image if available (encoded once in load_images)
+        image = self.images.get(task.image_path)
+        if image:
+            content.append(image)
+        
+        return content
+    
+    def model_options(self, model):
+        # Reasoning models take neither max_tokens nor temperature
+        if model in ["gpt-4o-mini", "gpt-4o", "gpt-4.1", "gpt-4.1-mini", "gpt-4.1-nano"]:
+            return {"max_output_tokens": 50, "temperature": 0}
+        return {}
+    
+    def query_model(self, model, content):
+        """Send one request to a model and return its answer (errors are raised)"""
+        options = self.model_options(model)
+        chat = provider.create_chat(model, SYSTEM_PROMPT, **options)
+        return chat.send(content).strip()
+    
+    def cached_result(self, model, task, content):
+        """Result from the response cache, or None if the request has to be sent"""
+        if self.cache is None or self.refresh:
+            return None
+        cached = self.cache.get(request_key(provider.name, model, self.model_options(model), content))
+        if cached is None:
+            return None
+        answer, elapsed_time = cached
+        return self.task_result(model, task, answer, elapsed_time, cached=True)
+    
+    def store_answer(self, model, content, answer, elapsed_time):
+        if self.cache is not None:
+            self.cache.put(request_key(provider.name, model, self.model_options(model), content), model, answer, elapsed_time)
+    
+    def task_result(self, model, task, answer, elapsed_time, cached=False):
+        # Check if answer is correct
+        is_correct = answer == task.correct_solution or task.correct_solution in answer
+        
+        return {
+            "model": model,
+            "question": task.question,
+            "correct_answer": task.correct_solution,
+            "model_answer": answer,
+            "is_correct": is_correct,
+            "time": elapsed_time,
+            "cached": cached
+        }
+    
+    def error_result(self, model, task, error, elapsed_time):
+        print(error)
+        return {
+            "model": model,
+            "question": task.question,
+            "correct_answer": task.correct_solution,
+            "model_answer": f"ERROR: {str(error)}",
+            "is_correct": False,
+            "time": elapsed_time
+        }
+    
+    async def run_task_async(self, model, task, limiter, executor, model_stats):
+        """Run a task within the model's rate limit; requests answered with 429 are retried"""
+        loop = asyncio.get_running_loop()
+        content = self.build_request(task)
+        cached = await loop.run_in_executor(executor, self.cached_result, model, task, content)
+        if cached:
+            return cached
+        
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            await limiter.acquire()
+            start_time = time.time()
+            model_stats["first_start"] = min(model_stats["first_start"], start_time)
+            try:
+                answer = await loop.run_in_executor(executor, self.query_model, model, content)
+                elapsed_time = time.time() - start_time
+                await loop.run_in_executor(executor, self.store_answer, model, content, answer, elapsed_time)
+                return self.task_result(model, task, answer, elapsed_time)
+            except Exception as e:
+                retry_after = rate_limit_retry_after(e)
+                if retry_after is None or attempt == RATE_LIMIT_RETRIES:
+                    return self.error_result(model, task, e, time.time() - start_time)
+                model_stats["rate_limited"] += 1
+                if not retry_after:
+                    backoff = min(RATE_LIMIT_BACKOFF_MAX, RATE_LIMIT_BACKOFF_BASE * 2 ** attempt)
+                    retry_after = backoff * (0.5 + random.random() / 2)
+                limiter.pause(retry_after)
+            finally:
+                limiter.slots.release()
+                model_stats["requests"] += 1
+                model_stats["bytes_sent"] += request_bytes(content)
+                model_stats["last_end"] = time.time()
+    
+    def open_run(self, run_id, resume=False):
+        """Open the journal of a run; with resume, the results already in it are not run again"""
+        run_dir = os.path.join(BENCHMARK_RUNS_DIR, run_id)
+        if resume and not os.path.isdir(run_dir):
+            raise ValueError(f"Run {run_id} not found in {BENCHMARK_RUNS_DIR}")
+        
+        self.journal = Journal(run_dir, "results")
+        self.completed = {}
+        if resume:
+            for record in self.journal.records():
+                if record.get("type") != "result":
+                    continue
+                task_index, result = record["task_index"], record["result"]
+                # Only results of the same task and without error count as done
+                if (task_index < len(self.tasks) and self.tasks[task_index].question == result["question"]
+                        and not result["model_answer"].startswith("ERROR:")):
+                    self.completed[(record["model"], task_index)] = result
+            print(f"Resuming run {run_id}: {len(self.completed)} task results already done")
+        
+        self.journal.append({
+            "type": "run",
+            "run_id": run_id,
+            "started": time.time(),
+            "models": MODELS,
+            "tasks_csv": self.tasks_csv,
+            "total_tasks": len(self.tasks)
+        })
+    
+    def summarize_model(self, model, model_results, total_tasks, model_stats=None):
+        """Summary of one model over its task results (model_stats: requests and timing of this run)"""
+        # Calculate model statistics
+        correct_count = sum(1 for r in model_results if r["is_correct"])
+        cached_count = sum(1 for r in model_results if r.get("cached"))
+        total_time = sum(r["time"] for r in model_results)
+        model_stats = model_stats or {"requests": 0, "rate_limited": 0, "bytes_sent": 0, "first_start": 0, "last_end": 0}
+        model_time = max(0, model_stats["last_end"] - min(model_stats["first_start"], model_stats["last_end"]))
+        
+        return {
+            "model": model,
+            "accuracy": correct_count / total_tasks if total_tasks else 0,
+            "correct_count": correct_count,
+            "total_tasks": total_tasks,
+            "avg_task_time": total_time / total_tasks if total_tasks else 0,
+            "total_time": total_time,
+            "wall_clock_time": model_time,
+            "requests": model_stats["requests"],
+            "rate_limited": model_stats["rate_limited"],
+            "cached": cached_count,
+            "requests_per_second": model_stats["requests"] / model_time if model_time else 0,
+            "bytes_sent": model_stats["bytes_sent"],
+            "results": model_results
+        }
+    
+    def results_from_journal(self, run_id):
+        """Rebuild the results of a run from its journal alone (the latest result per model and task)"""
+        run_dir = os.path.join(BENCHMARK_RUNS_DIR, run_id)
+        if not os.path.isdir(run_dir):
+            raise ValueError(f"Run {run_id} not found in {BENCHMARK_RUNS_DIR}")
+        
+        models = []
+        total_tasks = 0
+        latest = {}
+        for record in Journal(run_dir, "results").records():
+            if record.get("type") == "run":
+                models = record["models"]
+                total_tasks = record["total_tasks"]
+            elif record.get("type") == "result":
+                latest[(record["model"], record["task_index"])] = record["result"]
+        
+        # Models of earlier sessions of the run that are no longer in MODELS come last
+        models = models + sorted({model for model, _ in latest} - set(models))
+        return [
+            self.summarize_model(
+                model,
+                [result for (m, _), result in sorted(latest.items(), key=lambda item: item[0][1]) if m == model],
+                total_tasks
+            )
+            for model in models
+        ]
+    
+    def run_benchmark(self, max_workers=5, requests_per_minute=None):
+        """Run benchmark for all models and all tasks (all models concurrently, max_workers requests per model)"""
+        return asyncio.run(self.run_benchmark_async(max_workers, requests_per_minute))
+    
+    async def run_benchmark_async(self, max_workers=5, requests_per_minute=None):
+        start_time = time.time()
+        executor = ThreadPoolExecutor(max_workers=max_workers * len(MODELS))
+        limiters = {
+            model: ModelLimiter(
+                requests_per_minute or MODEL_REQUESTS_PER_MINUTE.get(model, DEFAULT_REQUESTS_PER_MINUTE),
+                max_workers
+            )
+            for model in MODELS
+        }
+        stats = {model: {"requests": 0, "rate_limited": 0, "bytes_sent": 0, "first_start": float("inf"), "last_end": start_time}
+                 for model in MODELS}
+        model_results = {model: {} for model in MODELS}  # model -> task index -> result
+        
+        print(f"Testing {len(MODELS)} models on {len(self.tasks)} tasks concurrently")
+        
+        async def run_one(model, task_index, task):
+            result = await self.run_task_async(model, task, limiters[model], executor, stats[model])
+            model_results[model][task_index] = result
+            if self.journal:
+                record = {"type": "result", "model": model, "task_index": task_index, "result": result}
+                await asyncio.get_running_loop().run_in_executor(executor, self.journal.append, record)
+            print(f"  - {model}: task {len(model_results[model])}/{len(self.tasks)} completed: {'✓' if result['is_correct'] else '✗'}")
+        
+        pending = []
+        for model in MODELS:
+            for task_index, task in enumerate(self.tasks):
+                if (model, task_index) in self.completed:
+                    model_results[model][task_index] = self.completed[(model, task_index)]
+                else:
+                    pending.append(run_one(model, task_index, task))
         
         try:
-            # Using the responses.create method for model evaluation
-            if model in ["gpt-4o-mini", "gpt-4o", "gpt-4.1", "gpt-4.1-mini", "gpt-4.1-nano"]:
-                response = client.chat.completions.create(
-                    model=model,
-                    messages=[
-                        {"role": "system", "content": "You are a math problem solver. Provide only the answer, no explanation."},
-                        {"role": "user", "content": content}
-                    ],
-                    max_tokens=50,
-                    temperature=0
-                )
-            else:
-                response = client.chat.completions.create(
-                    model=model,
-                    messages=[
-                        {"role": "system", "content": "You are a math problem solver. Provide only the answer, no explanation."},
-                        {"role": "user", "content": content}
-                    ],
-                )
-            
-            answer = response.choices[0].message.content.strip()
-            elapsed_time = time.time() - start_time
-            
-            # Check if answer is correct
-            is_correct = answer == task["correct_solution"] or task["correct_solution"] in answer
-            
-            return {
-                "model": model,
-                "question": task["question"],
-                "correct_answer": task["correct_solution"],
-                "model_answer": answer,
-                "is_correct": is_correct,
-                "time": elapsed_time
-            }
-        except Exception as e:
-            print(e)
-            return {
-                "model": model,
-                "question": task["question"],
-                "correct_answer": task["correct_solution"],
-                "model_answer": f"ERROR: {str(e)}",
-                "is_correct": False,
-                "time": time.time() - start_time
-            }
+            await asyncio.gather(*pending)
+        finally:
+            executor.shutdown(wait=False)
+        
+        return self.finish_run(model_results, stats, time.time() - start_time)
     
-    def run_benchmark(self, max_workers=5):
-        """Run benchmark for all models and all tasks"""
+    def finish_run(self, model_results, stats, elapsed):
+        """Summaries of all models from {model: {task index: result}}; prints them and keeps them in self.results"""
         results = []
-        
         for model in MODELS:
-            model_start_time = time.time()
-            model_results = []
-            
-            print(f"Testing model: {model}")
-            
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                # Submit all tasks for this model
-                future_to_task = {
-                    executor.submit(self.run_task, model, task): task 
-                    for task in self.tasks
-                }
-                
-                # Process results as they complete
-                for i, future in enumerate(as_completed(future_to_task)):
-                    task = future_to_task[future]
-                    try:
-                        result = future.result()
-                        model_results.append(result)
-                        print(f"  - Task {i+1}/{len(self.tasks)} completed: {'✓' if result['is_correct'] else '✗'}")
-                    except Exception as e:
-                        print(f"  - Task {i+1}/{len(self.tasks)} failed: {str(e)}")
-            
-            # Calculate model statistics
-            correct_count = sum(1 for r in model_results if r["is_correct"])
-            total_time = sum(r["time"] for r in model_results)
-            model_time = time.time() - model_start_time
-            
-            model_summary = {
-                "model": model,
-                "accuracy": correct_count / len(self.tasks) if self.tasks else 0,
-                "correct_count": correct_count,
-                "total_tasks": len(self.tasks),
-                "avg_task_time": total_time / len(self.tasks) if self.tasks else 0,
-                "total_time": total_time,
-                "wall_clock_time": model_time,
-                "results": model_results
-            }
-            
+            model_summary = self.summarize_model(
+                model, [result for _, result in sorted(model_results[model].items())], len(self.tasks), stats[model])
             results.append(model_summary)
             
             print(f"\nModel {model} summary:")
             print(f"  - Accuracy: {model_summary['accuracy']:.2%} ({model_summary['correct_count']}/{model_summary['total_tasks']})")
             print(f"  - Avg task time: {model_summary['avg_task_time']:.2f}s")
             print(f"  - Total processing time: {model_summary['total_time']:.2f}s")
-            print(f"  - Wall clock time: {model_summary['wall_clock_time']:.2f}s\n")
+            print(f"  - Wall clock time: {model_summary['wall_clock_time']:.2f}s")
+            print(f"  - Requests: {model_summary['requests']} ({model_summary['rate_limited']} rate limited), "
+                  f"{model_summary['requests_per_second']:.2f} req/s, {model_summary['cached']} answers from cache")
+            print(f"  - Bytes sent: {model_summary['bytes_sent'] / 1024:.0f} KB"
+                  f" ({model_summary['bytes_sent'] / max(1, model_summary['requests']) / 1024:.1f} KB per request)")
+        
+        total_requests = sum(model_stats["requests"] for model_stats in stats.values())
+        total_bytes = sum(model_stats["bytes_sent"] for model_stats in stats.values())
+        print(f"\nAll models: {total_requests} requests in {elapsed:.2f}s ({total_requests / elapsed if elapsed else 0:.2f} req/s), "
+              f"{total_bytes / 1024:.0f} KB sent\n")
         
         self.results = results
         return results
     
-    def save_results(self, filename="benchmark_results.json", excel_filename="benchmark_results.xlsx"):
-        """Save benchmark results to a file"""
+    def run_batch(self, client, poll_interval=BATCH_POLL_SECONDS):
+        """Run all tasks that are not done yet through the batch API (one or more batches per model)"""
+        start_time = time.time()
+        stats = {model: {"requests": 0, "rate_limited": 0, "bytes_sent": 0, "first_start": start_time, "last_end": start_time}
+                 for model in MODELS}
+        model_results = {model: {} for model in MODELS}
+        contents = {}   # (model, task index) -> content of the request
+        batches = {}    # batch ID -> (model, task indexes)
+        
+        for model in MODELS:
+            batch_requests = []
+            for task_index, task in enumerate(self.tasks):
+                if (model, task_index) in self.completed:
+                    model_results[model][task_index] = self.completed[(model, task_index)]
+                    continue
+                content = self.build_request(task)
+                cached = self.cached_result(model, task, content)
+                if cached:
+                    model_results[model][task_index] = cached
+                    continue
+                
+                contents[(model, task_index)] = content
+                batch_requests.append({
+                    "task_index": task_index,
+                    "custom_id": f"{model}:{task_index}",
+                    "body": {
+                        "model": model,
+                        "messages": [
+                            {"role": "system", "content": SYSTEM_PROMPT},
+                            {"role": "user", "content": openai_parts(content)}
+                        ],
+                        **openai_options(**self.model_options(model))
+                    }
+                })
+                stats[model]["requests"] += 1
+                stats[model]["bytes_sent"] += request_bytes(content)
+            
+            for i in range(0, len(batch_requests), BATCH_MAX_REQUESTS):
+                chunk = batch_requests[i:i + BATCH_MAX_REQUESTS]
+                batch = client.submit(chunk, name=f"benchmark-{model}-{i}.jsonl", metadata={"model": model})
+                batches[batch["id"]] = (model, [r["task_index"] for r in chunk])
+                print(f"Submitted batch {batch['id']} for {model} ({len(chunk)} requests)")
+        
+        def on_update(batch):
+            counts = batch.get("request_counts") or {}
+            print(f"  - {batches[batch['id']][0]}: batch {batch['status']} "
+                  f"({counts.get('completed', 0) + counts.get('failed', 0)}/{counts.get('total', 0)})")
+        
+        finished = client.wait(list(batches), poll_interval, on_update=on_update) if batches else {}
+        
+        for batch_id, batch in finished.items():
+            model, task_indexes = batches[batch_id]
+            stats[model]["last_end"] = time.time()
+            answers = client.results(batch) if batch["status"] == "completed" else {}
+            turnaround = (batch.get("completed_at") or time.time()) - batch.get("created_at", start_time)
+            
+            for task_index in task_indexes:
+                task = self.tasks[task_index]
+                content = contents[(model, task_index)]
+                answer, error = answers.get(f"{model}:{task_index}", (None, f"no result (batch {batch['status']})"))
+                # A batch has no per-request latency; the time of a result is the batch turnaround
+                if error is None:
+                    self.store_answer(model, content, answer, turnaround)
+                    result = self.task_result(model, task, answer, turnaround)
+                else:
+                    result = self.error_result(model, task, error, turnaround)
+                result["batch_id"] = batch_id
+                model_results[model][task_index] = result
+                if self.journal:
+                    self.journal.append({"type": "result", "model": model, "task_index": task_index, "result": result})
+        
+        return self.finish_run(model_results, stats, time.time() - start_time)
+    
+    def save_results(self, filename="benchmark_results.json", excel_filename="benchmark_results.xlsx", run_id=None):
+        """Save benchmark results to a file (with run_id: the results rebuilt from the run's journal)"""
+        if run_id:
+            self.results = self.results_from_journal(run_id)
+        
         # Save to JSON
         with open(filename, "w", encoding="utf-8") as f:
             json.dump(self.results, f, indent=2)
@@ -280,9 +599,37 @@ class Benchmark:
         wb.save(filename)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark LLMs on the math tasks")
+    parser.add_argument("--max-workers", type=int, default=5, help="concurrent requests per model")
+    parser.add_argument("--rpm", type=int, help="requests per minute per model (default: MODEL_REQUESTS_PER_MINUTE)")
+    parser.add_argument("--cache", default=RESPONSE_CACHE_PATH, help="response cache database")
+    parser.add_argument("--cache-ttl", type=float, default=RESPONSE_CACHE_TTL_SECONDS, help="seconds a cached answer stays valid")
+    parser.add_argument("--no-cache", action="store_true", help="neither read nor write the response cache")
+    parser.add_argument("--refresh", action="store_true", help="query all models again and update the cache")
+    parser.add_argument("--run-id", help=f"name of the run journal in {BENCHMARK_RUNS_DIR}/ (default: start time)")
+    parser.add_argument("--resume", metavar="RUN_ID", help="continue an interrupted run, skipping finished tasks")
+    parser.add_argument("--rebuild", metavar="RUN_ID", help="only write the JSON/Excel files from a run journal")
+    parser.add_argument("--max-image-size", type=int, help="downscale images to this many pixels per side (needs Pillow)")
+    parser.add_argument("--batch", action="store_true", help="send all requests through the batch API")
+    parser.add_argument("--batch-url", help="batch API base URL (default: $OPENAI_BASE_URL or the OpenAI API)")
+    parser.add_argument("--poll-interval", type=float, default=BATCH_POLL_SECONDS, help="seconds between batch status checks")
+    args = parser.parse_args()
+    
+    if args.rebuild:
+        benchmark = Benchmark()
+        benchmark.save_results(run_id=args.rebuild)
+        raise SystemExit
+    
     print("Starting benchmark of OpenAI models on math tasks...")
-    benchmark = Benchmark()
-    results = benchmark.run_benchmark()
+    cache = None if args.no_cache else ResponseCache(args.cache, args.cache_ttl)
+    benchmark = Benchmark(cache=cache, refresh=args.refresh, max_image_size=args.max_image_size)
+    run_id = args.resume or args.run_id or time.strftime("%Y%m%d-%H%M%S")
+    benchmark.open_run(run_id, resume=bool(args.resume))
+    print(f"Run ID: {run_id} (continue an interrupted run with --resume {run_id})")
+    if args.batch:
+        results = benchmark.run_batch(BatchClient(args.batch_url), args.poll_interval)
+    else:
+        results = benchmark.run_benchmark(args.max_workers, args.rpm)
     
     # Print final summary
     print("\n=== FINAL BENCHMARK RESULTS ===")
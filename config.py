@@ -14,6 +14,60 @@ QUESTION_TIME_SECONDS = 420
 CERTAINTY_TIME_SECONDS = 30
 WAITING_TIME_SECONDS = 10
 
+# Seconds after a deadline before the server times out a question itself (the browser
+# normally reports the timeout; if it does not, the session counts as abandoned)
+TIMER_GRACE_SECONDS = 90
+# Session data is removed after this many seconds without a request
+SESSION_IDLE_SECONDS = 2 * 60 * 60
+# The last access time of a session is written to the session store at most once per interval
+SESSION_TOUCH_INTERVAL_SECONDS = 60
+# Memory budget of the in-process session store (SESSION_STORE=memory); above it, the least
+# recently used completed sessions and sessions idle for SESSION_EVICT_IDLE_SECONDS are evicted
+SESSION_CACHE_MAX_BYTES = 256 * 1024 * 1024
+SESSION_EVICT_IDLE_SECONDS = 15 * 60
+
+# Per-session LLM chat registry (idle expiry in seconds, max number of live chats)
+CHAT_SESSION_IDLE_SECONDS = 30 * 60
+CHAT_SESSION_MAX_ENTRIES = 500
+
+# Uploaded task images are reused until this many seconds before the remote file expires
+IMAGE_HANDLE_REFRESH_MARGIN_SECONDS = 60 * 60
+# Fallback lifetime of an uploaded file if the API does not report an expiration time
+IMAGE_HANDLE_TTL_SECONDS = 47 * 60 * 60
+
+# Stream assistant responses token by token (Server-Sent Events via /chat/stream)
+CHAT_STREAMING = True
+
+# LLM calls run on a bounded thread pool: concurrent calls, additional queued calls
+# and seconds a request waits for its answer before giving up
+LLM_MAX_CONCURRENCY = 8
+LLM_QUEUE_DEPTH = 16
+LLM_TIMEOUT_SECONDS = 90
+ASSISTANT_BUSY_MESSAGE = "The assistant is busy helping other participants right now. Please send your message again in a moment."
+
+# Server push channel (/events): seconds between checks of the SQLite session store for changes
+# from other workers (changes from the same worker wake the stream at once), seconds between
+# keep-alive comments, lifetime of one stream before the browser reconnects, and the reconnect
+# delay in milliseconds
+EVENTS_POLL_SECONDS = 2
+EVENTS_HEARTBEAT_SECONDS = 15
+EVENTS_MAX_SECONDS = 5 * 60
+EVENTS_RETRY_MS = 1000
+# Every open stream occupies one worker thread (gunicorn gthread) for up to EVENTS_MAX_SECONDS.
+# At most this many streams per worker process; further browsers fall back to polling. Keep it
+# well below gunicorn's --threads (railway.json: 256) so /command and /chat always find a thread.
+EVENTS_MAX_STREAMS = 192
+
+# Result uploads to Sciebo: retry delay after the first failed upload (doubled after each
+# further failure up to the maximum), number of results uploaded together in one file
+# (1 = one file per participant) and number of uploads running in parallel
+UPLOAD_RETRY_BASE_SECONDS = 2
+UPLOAD_RETRY_MAX_SECONDS = 5 * 60
+UPLOAD_BATCH_SIZE = 1
+UPLOAD_MAX_PARALLEL = 2
+# Size at which the local results journal (results/journal) starts a new segment file
+JOURNAL_MAX_BYTES = 64 * 1024 * 1024
+
 # Group-specific prompt engineering templates
 TREATMENT_GROUP_PROMPT = """You are an active and cooperative Mathematical Assistant. Your task is to assist users in solving math problems. You never provide them with the correct answer, but assist them in finding the right answer.
 You use many explicit language cues demonstrating that you are active and cooperative. Your answers should always be concise, but not exhaustive.
@@ -0,0 +1,257 @@
+"""
+Append-only JSONL journals: a shared journal with group commit (Journal) and one small
+event log per session (EventLog).
+
+Journal: every record is one JSON line. append() returns once the line is on disk: the
+first waiting writer writes and fsyncs everything buffered so far (its own line and those
+of threads that arrived meanwhile), so concurrent appends share one fsync. Each process
+writes its own segment files (<prefix>-<start time>-<pid>.jsonl) and starts a new
+segment once the current one exceeds max_bytes, so processes never contend for a file.
+
+EventLog: one JSONL file per session with the same group commit. The writing thread
+appends the buffered lines of all waiting threads and fsyncs each touched file once per
+batch; files stay open between batches (the max_open most recently written ones).
+
+    python journal.py results/journal --export results/export
+"""
+import argparse
+import collections
+import glob
+import json
+import os
+import threading
+import time
+
+
+class Journal:
+    def __init__(self, directory, prefix="results", max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.condition = threading.Condition()
+        self.buffer = []
+        self.next_seq = 1      # Sequence number of the next appended record
+        self.durable_seq = 0   # All records up to this sequence number are on disk
+        self.flushing = False
+        self.file = None
+        self.size = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _open_segment(self):
+        if self.file:
+            self.file.close()
+        path = os.path.join(self.directory, f"{self.prefix}-{time.time_ns()}-{os.getpid()}.jsonl")
+        self.file = open(path, "ab")
+        self.size = 0
+
+    def _write(self, lines):
+        """Write and fsync a batch of lines (called by one thread at a time)"""
+        data = b"".join(lines)
+        if self.file is None or (self.size and self.size + len(data) > self.max_bytes):
+            self._open_segment()
+        self.file.write(data)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.size += len(data)
+
+    def append(self, record):
+        """Append a record and wait until it is on disk"""
+        line = (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+        with self.condition:
+            self.buffer.append(line)
+            seq = self.next_seq
+            self.next_seq += 1
+
+            while self.durable_seq < seq:
+                if self.flushing:
+                    # Another thread is writing; our line goes into the next batch
+                    self.condition.wait()
+                    continue
+
+                self.flushing = True
+                batch, self.buffer = self.buffer, []
+                batch_end = self.next_seq - 1
+                self.condition.release()
+                try:
+                    self._write(batch)
+                except Exception:
+                    self.condition.acquire()
+                    self.flushing = False
+                    self.buffer = batch + self.buffer
+                    self.condition.notify_all()
+                    raise
+                self.condition.acquire()
+                self.flushing = False
+                self.durable_seq = batch_end
+                self.condition.notify_all()
+
+    def segments(self):
+        """All segment files of this journal (of all processes), oldest first"""
+        paths = glob.glob(os.path.join(self.directory, f"{self.prefix}-*.jsonl"))
+        return sorted(paths, key=lambda path: int(os.path.basename(path).split("-")[-2]))
+
+    def records(self):
+        """Iterate over all records; a line cut off by a crash is skipped"""
+        for path in self.segments():
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        print(f"Skipping damaged journal line in {path}")
+
+    def close(self):
+        with self.condition:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+
+class EventLog:
+    """One append-only JSONL file per session; append() returns once the event is on disk"""
+
+    def __init__(self, directory, max_open=256):
+        self.directory = directory
+        self.max_open = max_open
+        self.condition = threading.Condition()
+        self.buffer = []       # [(session_id, line)]
+        self.next_seq = 1      # Sequence number of the next appended event
+        self.durable_seq = 0   # All events up to this sequence number are on disk
+        self.flushing = False
+        self.files = collections.OrderedDict()  # session_id -> fd, least recently written first
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, session_id):
+        return os.path.join(self.directory, f"{session_id}.jsonl")
+
+    def _fd(self, session_id):
+        fd = self.files.pop(session_id, None)
+        if fd is not None and os.fstat(fd).st_nlink == 0:
+            # Deleted by another process; appending would go to the unlinked file
+            os.close(fd)
+            fd = None
+        if fd is None:
+            fd = os.open(self.path(session_id), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self.files[session_id] = fd
+        return fd
+
+    def _write(self, batch):
+        """Write a batch of (session_id, line) and fsync every touched file once (called by one
+        thread at a time); on failure, batch keeps only the events that were not written"""
+        lines = {}
+        for session_id, line in batch:
+            lines.setdefault(session_id, []).append(line)
+        written = set()
+        try:
+            for session_id, session_lines in lines.items():
+                os.write(self._fd(session_id), b"".join(session_lines))
+                written.add(session_id)
+            for session_id in written:
+                os.fsync(self.files[session_id])
+        except Exception:
+            batch[:] = [(session_id, line) for session_id, line in batch if session_id not in written]
+            raise
+        finally:
+            while len(self.files) > self.max_open:
+                os.close(self.files.popitem(last=False)[1])
+
+    def append(self, session_id, event):
+        """Append an event and wait until it is on disk"""
+        line = (json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+        with self.condition:
+            self.buffer.append((session_id, line))
+            seq = self.next_seq
+            self.next_seq += 1
+
+            while self.durable_seq < seq:
+                if self.flushing:
+                    # Another thread is writing; our event goes into the next batch
+                    self.condition.wait()
+                    continue
+
+                self.flushing = True
+                batch, self.buffer = self.buffer, []
+                batch_end = self.next_seq - 1
+                self.condition.release()
+                try:
+                    self._write(batch)
+                except Exception:
+                    self.condition.acquire()
+                    self.flushing = False
+                    self.buffer = batch + self.buffer
+                    self.condition.notify_all()
+                    raise
+                self.condition.acquire()
+                self.flushing = False
+                self.durable_seq = batch_end
+                self.condition.notify_all()
+
+    def events(self, session_id):
+        """All events of a session in order (empty if there are none); a line cut off by a crash is skipped"""
+        events = []
+        try:
+            with open(self.path(session_id), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        events.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        print(f"Skipping damaged event of session {session_id}")
+        except FileNotFoundError:
+            pass
+        return events
+
+    def size(self, session_id):
+        """Bytes in the log of a session (0 if there is none); grows with every append"""
+        try:
+            return os.path.getsize(self.path(session_id))
+        except FileNotFoundError:
+            return 0
+
+    def delete(self, session_id):
+        with self.condition:
+            # Wait for a running batch, it may still use the open file
+            while self.flushing:
+                self.condition.wait()
+            fd = self.files.pop(session_id, None)
+            if fd is not None:
+                os.close(fd)
+            try:
+                os.remove(self.path(session_id))
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        with self.condition:
+            while self.flushing:
+                self.condition.wait()
+            while self.files:
+                os.close(self.files.popitem()[1])
+
+
+def export_results(journal, target_dir):
+    """Write the latest result of every participant as results_<prolific_id>.json (as uploaded to Sciebo)"""
+    latest = {}
+    for record in journal.records():
+        latest[record.get("prolific_id")] = record
+
+    os.makedirs(target_dir, exist_ok=True)
+    for prolific_id, record in latest.items():
+        with open(os.path.join(target_dir, f"results_{prolific_id}.json"), "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+    return len(latest)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or export a results journal")
+    parser.add_argument("directory", help="journal directory, e.g. results/journal")
+    parser.add_argument("--prefix", default="results")
+    parser.add_argument("--export", metavar="DIR", help="write one results_<prolific_id>.json per participant")
+    args = parser.parse_args()
+
+    journal = Journal(args.directory, args.prefix)
+    if args.export:
+        print(f"Exported {export_results(journal, args.export)} results to {args.export}")
+    else:
+        print(f"{sum(1 for _ in journal.records())} records in {len(journal.segments())} segment(s)")
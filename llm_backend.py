@@ -0,0 +1,374 @@
+"""
+LLM providers behind one small interface, used by the chat routes in main.py and by
+benchmark.py:
+
+    provider = create_provider("gemini")        # or "openai", "fake"; default: $LLM_PROVIDER
+    chat = provider.create_chat(model, system_prompt, temperature=0, max_output_tokens=2000)
+    text = chat.send(["Current math question: ...", provider.upload_file(path, "image/jpeg")])
+    for token in chat.stream(["User message: ..."]):
+        ...
+
+Message contents are lists of text strings, files returned by upload_file() and
+InlineImage objects. create_chat(..., history=[(user contents, assistant text), ...])
+starts a chat that continues earlier turns, e.g. when a chat is rebuilt in another
+process.
+
+The SDKs are imported when a provider is created, so the fake provider works without
+them and without API keys. The fake provider answers after a configurable log-normal
+latency at a configurable token rate, for profiling and load tests; with rate_limit it
+rejects requests above that rate like an API answering 429.
+
+rate_limit_retry_after(error) tells callers whether an error was a rate limit and how long
+the provider asked them to wait.
+"""
+import base64
+import email.utils
+import hashlib
+import itertools
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+
+
+class RateLimitError(Exception):
+    """Request rejected because of a rate limit (HTTP 429)"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value):
+    """Seconds from a Retry-After header (delay in seconds or HTTP date), None if unparsable"""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def rate_limit_retry_after(error):
+    """None if error is not a rate limit error, otherwise the requested delay in seconds (0 if none given)"""
+    if isinstance(error, RateLimitError):
+        return error.retry_after or 0
+    # OpenAI errors carry status_code, google-genai errors code; both keep the HTTP response
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if status != 429:
+        return None
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        delay = parse_retry_after(retry_after_ms)
+        if delay is not None:
+            return delay / 1000
+    return parse_retry_after(headers.get("retry-after")) or 0
+
+
+class UploadedFile:
+    """File uploaded to a provider; native is the provider's own handle"""
+    __slots__ = ("name", "native", "expires_at")
+
+    def __init__(self, name, native, expires_at=None):
+        self.name = name
+        self.native = native
+        self.expires_at = expires_at  # Unix time, None if unknown
+
+
+class InlineImage:
+    """Image sent with the message itself"""
+    __slots__ = ("data", "mime_type", "_base64", "_digest")
+
+    def __init__(self, data, mime_type="image/jpeg"):
+        self.data = data
+        self.mime_type = mime_type
+        self._base64 = None
+        self._digest = None
+
+    @classmethod
+    def from_file(cls, path, mime_type="image/jpeg"):
+        with open(path, "rb") as f:
+            return cls(f.read(), mime_type)
+
+    def data_url(self):
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self.data).decode("ascii")
+        return f"data:{self.mime_type};base64,{self._base64}"
+
+    def digest(self):
+        """SHA-256 of the image bytes"""
+        if self._digest is None:
+            self._digest = hashlib.sha256(self.data).hexdigest()
+        return self._digest
+
+
+class GeminiChat:
+    def __init__(self, provider, chat):
+        self.provider = provider
+        self.chat = chat
+
+    def send(self, contents):
+        return self.chat.send_message(self.provider.parts(contents)).text or ""
+
+    def stream(self, contents):
+        for chunk in self.chat.send_message_stream(self.provider.parts(contents)):
+            text = getattr(chunk, "text", None)
+            if text:
+                yield text
+
+
+class GeminiProvider:
+    name = "gemini"
+    default_model = "gemini-2.0-flash"
+
+    def __init__(self, api_key=None):
+        from google import genai
+        from google.genai import types
+
+        self.api_key = api_key or os.getenv("GEMINI_API_KEY")
+        self.genai = genai
+        self.types = types
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        # Created on first use: without a key the app still starts, only chats fail
+        with self._lock:
+            if self._client is None:
+                if not self.api_key:
+                    raise ValueError("GEMINI_API_KEY environment variable is not set")
+                self._client = self.genai.Client(api_key=self.api_key)
+            return self._client
+
+    def parts(self, contents):
+        parts = []
+        for item in contents:
+            if isinstance(item, UploadedFile):
+                parts.append(item.native)
+            elif isinstance(item, InlineImage):
+                parts.append(self.types.Part.from_bytes(data=item.data, mime_type=item.mime_type))
+            else:
+                parts.append(item)
+        return parts
+
+    def create_chat(self, model, system_prompt, temperature=None, max_output_tokens=None, history=None):
+        contents = []
+        for user_contents, answer in history or ():
+            contents.append(self.types.UserContent(parts=self.parts(user_contents)))
+            contents.append(self.types.ModelContent(parts=[answer]))
+        chat = self.client.chats.create(
+            model=model,
+            config=self.types.GenerateContentConfig(
+                system_instruction=system_prompt,
+                temperature=temperature,
+                response_modalities=["TEXT"],
+                max_output_tokens=max_output_tokens
+            ),
+            history=contents
+        )
+        return GeminiChat(self, chat)
+
+    def upload_file(self, path, mime_type):
+        native = self.client.files.upload(
+            file=path,
+            config=self.types.UploadFileConfig(mime_type=mime_type, display_name=path)
+        )
+        expiration_time = getattr(native, "expiration_time", None)
+        return UploadedFile(path, native, expiration_time.timestamp() if expiration_time is not None else None)
+
+
+def openai_parts(contents):
+    """Message contents in the chat completions format (also used for batch requests)"""
+    parts = []
+    for item in contents:
+        if isinstance(item, UploadedFile):
+            item = item.native
+        if isinstance(item, InlineImage):
+            parts.append({"type": "image_url", "image_url": {"url": item.data_url()}})
+        else:
+            parts.append({"type": "text", "text": item})
+    return parts
+
+
+def openai_options(temperature=None, max_output_tokens=None):
+    options = {}
+    if temperature is not None:
+        options["temperature"] = temperature
+    if max_output_tokens is not None:
+        options["max_tokens"] = max_output_tokens
+    return options
+
+
+class OpenAIChat:
+    """Chat completions are stateless; the chat keeps the message history itself"""
+
+    def __init__(self, provider, model, system_prompt, options, history=None):
+        self.provider = provider
+        self.model = model
+        self.options = options
+        self.messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
+        for user_contents, answer in history or ():
+            self.messages.append({"role": "user", "content": provider.parts(user_contents)})
+            self.messages.append({"role": "assistant", "content": answer})
+
+    def _request(self, contents):
+        return self.messages + [{"role": "user", "content": self.provider.parts(contents)}]
+
+    def send(self, contents):
+        messages = self._request(contents)
+        response = self.provider.client.chat.completions.create(model=self.model, messages=messages, **self.options)
+        text = response.choices[0].message.content or ""
+        self.messages = messages + [{"role": "assistant", "content": text}]
+        return text
+
+    def stream(self, contents):
+        messages = self._request(contents)
+        response = self.provider.client.chat.completions.create(
+            model=self.model, messages=messages, stream=True, **self.options)
+        parts = []
+        for chunk in response:
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if text:
+                parts.append(text)
+                yield text
+        self.messages = messages + [{"role": "assistant", "content": "".join(parts)}]
+
+
+class OpenAIProvider:
+    name = "openai"
+    default_model = "gpt-4o-mini"
+
+    def __init__(self, api_key=None):
+        from openai import OpenAI
+
+        self.client = OpenAI(api_key=api_key or os.getenv("OPENAI_API_KEY"))
+
+    def parts(self, contents):
+        return openai_parts(contents)
+
+    def create_chat(self, model, system_prompt, temperature=None, max_output_tokens=None, history=None):
+        return OpenAIChat(self, model, system_prompt, openai_options(temperature, max_output_tokens), history)
+
+    def upload_file(self, path, mime_type):
+        # Chat completions take images only inline: "uploading" reads and encodes the file once
+        image = InlineImage.from_file(path, mime_type)
+        image.data_url()
+        return UploadedFile(path, image)
+
+
+class FakeChat:
+    def __init__(self, provider, model, max_output_tokens, turns=0):
+        self.provider = provider
+        self.model = model
+        self.max_output_tokens = max_output_tokens
+        self.turns = turns
+
+    def _tokens(self):
+        self.turns += 1
+        count = self.provider.reply_tokens
+        if self.max_output_tokens:
+            count = min(count, self.max_output_tokens)
+        return [f"{word} " for word in itertools.islice(itertools.cycle(self.provider.words), count)]
+
+    def send(self, contents):
+        self.provider.check_rate_limit(self.model)
+        tokens = self._tokens()
+        first_token, per_token = self.provider.timing()
+        time.sleep(first_token + per_token * len(tokens))
+        return "".join(tokens).strip()
+
+    def stream(self, contents):
+        self.provider.check_rate_limit(self.model)
+        tokens = self._tokens()
+        first_token, per_token = self.provider.timing()
+        time.sleep(first_token)
+        for token in tokens:
+            time.sleep(per_token)
+            yield token
+
+
+class FakeProvider:
+    """Offline provider: the first token after a log-normal latency (median latency seconds,
+    sigma latency_jitter), then reply_tokens tokens at a log-normal token_rate per second;
+    more than rate_limit requests per second and model are rejected with RateLimitError"""
+    name = "fake"
+    default_model = "fake"
+    words = "Let us look at the problem step by step and start with what is given".split()
+
+    def __init__(self, latency=1.0, latency_jitter=0.5, token_rate=50.0, token_rate_jitter=0.3,
+                 reply_tokens=60, upload_latency=0.2, rate_limit=None, seed=None):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.token_rate = token_rate
+        self.token_rate_jitter = token_rate_jitter
+        self.reply_tokens = reply_tokens
+        self.upload_latency = upload_latency
+        self.rate_limit = rate_limit
+        self.requests = defaultdict(deque)  # model -> times of the requests in the last second
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"chats": 0, "uploads": 0, "rate_limited": 0}
+
+    def check_rate_limit(self, model):
+        if not self.rate_limit:
+            return
+        now = time.monotonic()
+        with self.lock:
+            window = self.requests[model]
+            while window and now - window[0] >= 1:
+                window.popleft()
+            if len(window) >= self.rate_limit:
+                self.stats["rate_limited"] += 1
+                raise RateLimitError(f"Rate limit of {self.rate_limit} requests/s for {model} exceeded",
+                                     retry_after=1 - (now - window[0]))
+            window.append(now)
+
+    def timing(self):
+        """(seconds to the first token, seconds per further token) of one answer"""
+        with self.lock:
+            first_token = self.latency * self.random.lognormvariate(0, self.latency_jitter) if self.latency else 0
+            rate = self.token_rate * self.random.lognormvariate(0, self.token_rate_jitter) if self.token_rate else 0
+        return first_token, (1 / rate if rate else 0)
+
+    def create_chat(self, model, system_prompt, temperature=None, max_output_tokens=None, history=None):
+        with self.lock:
+            self.stats["chats"] += 1
+        return FakeChat(self, model, max_output_tokens, len(history or ()))
+
+    def upload_file(self, path, mime_type):
+        time.sleep(self.upload_latency)
+        with self.lock:
+            self.stats["uploads"] += 1
+        return UploadedFile(path, None, time.time() + 48 * 60 * 60)
+
+
+PROVIDERS = {provider.name: provider for provider in (GeminiProvider, OpenAIProvider, FakeProvider)}
+
+
+def fake_options_from_env():
+    """FakeProvider settings from LLM_FAKE_LATENCY, LLM_FAKE_LATENCY_JITTER, LLM_FAKE_TOKEN_RATE, ..."""
+    options = {}
+    for option, cast in (("latency", float), ("latency_jitter", float), ("token_rate", float),
+                         ("token_rate_jitter", float), ("reply_tokens", int), ("upload_latency", float),
+                         ("rate_limit", float)):
+        value = os.getenv(f"LLM_FAKE_{option.upper()}")
+        if value:
+            options[option] = cast(value)
+    return options
+
+
+def create_provider(name=None, **options):
+    """Provider by name ("gemini", "openai" or "fake"; default: $LLM_PROVIDER or gemini)"""
+    name = (name or os.getenv("LLM_PROVIDER") or "gemini").lower()
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown LLM provider '{name}', expected one of {', '.join(PROVIDERS)}")
+    if name == "fake":
+        options = {**fake_options_from_env(), **options}
+    return PROVIDERS[name](**options)
@@ -0,0 +1,172 @@
+"""
+Load test: drives the real Flask app through the whole study with many concurrent
+participants and reports latency percentiles per route, throughput and memory growth.
+
+Every participant is a thread with its own test client (its own session cookie) and goes
+through / -> Prolific ID -> practice question -> waiting phase -> main questions ->
+summary, chatting with the assistant and polling /status while thinking. The LLM is the
+fake provider from llm_backend.py with configurable latency and token rate, and results
+are uploaded to the local WebDAV stand-in, so the test runs offline.
+
+    python load_test.py --participants 200 --concurrency 50 --llm-latency 1.5
+"""
+import argparse
+import contextlib
+import io
+import math
+import os
+import random
+import resource
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from webdav_standin import start_standin
+
+# main.py reads its settings at import time
+standin = start_standin()
+os.environ["SCIEBO_URL"] = standin.url
+os.environ["SCIEBO_DIRECTORY"] = "results"
+os.environ["NO_PROXY"] = "127.0.0.1"
+os.environ["LLM_PROVIDER"] = "fake"
+standin.dirs.add("results")
+
+import config
+import main
+from llm_backend import FakeProvider
+
+
+class Recorder:
+    """Durations per route, shared by all participant threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.durations = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def request(self, client, method, path, **kwargs):
+        route = f"{method} {path.split('?')[0]}"
+        start = time.perf_counter()
+        response = client.open(path, method=method, **kwargs)
+        data = response.get_data()
+        response.close()
+        elapsed = (time.perf_counter() - start) * 1000
+        with self.lock:
+            self.durations[route].append(elapsed)
+            if response.status_code >= 400:
+                self.errors[route] += 1
+        return response, data
+
+
+def think(recorder, client, seconds, poll_interval, state):
+    """Wait like a participant reading the question, polling /status like the browser"""
+    end = time.time() + seconds
+    while True:
+        response, _ = recorder.request(client, "GET", f"/status?right_seq={state['right_seq']}")
+        status = response.get_json() or {}
+        state["right_seq"] = (status.get("right") or {}).get("seq", state["right_seq"])
+        if time.time() + poll_interval > end:
+            return status
+        time.sleep(poll_interval)
+
+
+def run_participant(number, recorder, args):
+    """One participant from the start page to the summary; returns True if the summary was reached"""
+    client = main.app.test_client()
+    state = {"right_seq": 0}
+    chat_path = "/chat/stream" if args.stream else "/chat"
+
+    recorder.request(client, "GET", "/")
+    recorder.request(client, "POST", "/command", json={"input": f"LOAD{number:06d}"})
+
+    for _ in range(config.TEST_TASKS_COUNT + config.MAIN_TASKS_COUNT + 10):
+        status = think(recorder, client, args.think_time, args.poll_interval, state)
+        phase = status.get("phase")
+
+        if phase == "waiting":
+            recorder.request(client, "POST", "/command", json={"input": ""})
+        elif phase == "questions":
+            if status.get("certainty_pending"):
+                recorder.request(client, "POST", "/command", json={"input": str(random.randint(1, 4))})
+                continue
+            for i in range(args.chats):
+                recorder.request(client, "POST", chat_path, json={"message": f"Can you give me a hint? ({i})"})
+            letter = chr(ord("a") + random.randrange(config.NUM_ANSWERS))
+            recorder.request(client, "POST", "/command", json={"input": letter})
+        else:
+            return phase == "summary"
+    return False
+
+
+def rss_bytes():
+    """Current resident set size (peak size where /proc is not available)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of sorted values"""
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+def report(recorder, elapsed, finished, participants, rss_before, rss_after):
+    print(f"\n{'Route':<20} {'requests':>9} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    total = 0
+    for route in sorted(recorder.durations):
+        durations = sorted(recorder.durations[route])
+        total += len(durations)
+        print(f"{route:<20} {len(durations):>9} {recorder.errors[route]:>7} {percentile(durations, 0.50):>9.1f} "
+              f"{percentile(durations, 0.95):>9.1f} {percentile(durations, 0.99):>9.1f} {durations[-1]:>9.1f}")
+
+    print(f"\nParticipants finished: {finished}/{participants} in {elapsed:.1f} s")
+    print(f"Throughput: {total / elapsed:.1f} requests/s, {finished / elapsed * 60:.1f} participants/min")
+    print(f"Memory (RSS): {rss_before / 2**20:.1f} MB -> {rss_after / 2**20:.1f} MB "
+          f"(+{(rss_after - rss_before) / 2**10 / max(1, participants):.1f} KB per participant)")
+    print(f"Session store: {main.session_store.stats()}")
+    print(f"Results uploaded: {standin.stats['uploads']}, LLM: {main.llm_provider.stats}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test of the full study flow with simulated participants")
+    parser.add_argument("--participants", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=20, help="participants active at the same time")
+    parser.add_argument("--chats", type=int, default=1, help="chat messages per question")
+    parser.add_argument("--stream", action="store_true", help="use /chat/stream instead of /chat")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="median seconds to the first token of an answer")
+    parser.add_argument("--llm-jitter", type=float, default=0.5, help="sigma of the log-normal LLM latency")
+    parser.add_argument("--llm-token-rate", type=float, default=50, help="median tokens per second (0: no delay)")
+    parser.add_argument("--llm-reply-tokens", type=int, default=60, help="tokens per answer")
+    parser.add_argument("--think-time", type=float, default=2.0, help="seconds a participant spends per step")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="seconds between /status polls")
+    parser.add_argument("--waiting-seconds", type=int, default=0, help="length of the waiting phase")
+    parser.add_argument("--verbose", action="store_true", help="show the log output of the app")
+    args = parser.parse_args()
+
+    config.WAITING_TIME_SECONDS = args.waiting_seconds
+    main.llm_provider = FakeProvider(latency=args.llm_latency, latency_jitter=args.llm_jitter,
+                                     token_rate=args.llm_token_rate, reply_tokens=args.llm_reply_tokens,
+                                     upload_latency=args.llm_latency / 2)
+    recorder = Recorder()
+
+    print(f"{args.participants} participants, {args.concurrency} concurrent, "
+          f"LLM latency {args.llm_latency:.2f} s, session store {type(main.session_store).__name__}")
+    rss_before = rss_bytes()
+    # The app logs every step of every participant; keep the report readable
+    with contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            outcomes = list(pool.map(lambda n: run_participant(n, recorder, args), range(args.participants)))
+        elapsed = time.perf_counter() - start
+
+        # Let the upload queue drain before counting the uploads
+        deadline = time.time() + 30
+        while (main.result_uploads.pending() or os.listdir(main.result_uploads.uploading_dir)) and time.time() < deadline:
+            time.sleep(0.1)
+
+    report(recorder, elapsed, sum(outcomes), args.participants, rss_before, rss_bytes())
+    main.result_uploads.stop()
+    standin.shutdown()
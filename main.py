@@ -1,62 +1,187 @@
-from flask import Flask, render_template, request, jsonify, session
-import csv
+from flask import Flask, Response, render_template, request, jsonify, session, stream_with_context, g
+from flask.json.provider import DefaultJSONProvider
 import os
 import time
 import secrets
 import random
 import json
-import shutil
 import threading
-from google import genai
-from google.genai import types
+import hashlib
+import queue
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from dotenv import load_dotenv
-from webdav3.client import Client
 import config
+from session_store import create_session_store
+from timer_engine import DeadlineScheduler
+from task_bank import TaskBank
+from result_uploader import UploadQueue
+from webdav_uploader import WebDAVUploader
+from journal import Journal, EventLog
+from records import TaskRecord, ChatTurn, UserInput
+from llm_backend import create_provider
+import metrics
 
 load_dotenv()
 
-api_key = os.getenv('GEMINI_API_KEY')
-if not api_key:
-    raise ValueError("GEMINI_API_KEY environment variable is not set")
+# LLM-Anbieter aus LLM_PROVIDER (gemini, openai oder fake); ohne API-Key startet die App, nur der Chat schlägt fehl
+llm_provider = create_provider(os.getenv('LLM_PROVIDER', 'gemini'))
+LLM_MODEL = os.getenv('LLM_ENGINE', llm_provider.default_model)
 
-LLM_MODEL = os.getenv('LLM_ENGINE', 'gemini-2.0-flash')
-genai_client = genai.Client(api_key=api_key)
+# Optionale Zeitmessung der Request-Phasen (/metrics, mit METRICS_LOG_REQUESTS eine JSON-Logzeile pro Request)
+metrics.configure(
+    os.getenv('METRICS_ENABLED', 'False').lower() == 'true',
+    os.getenv('METRICS_LOG_REQUESTS', 'False').lower() == 'true'
+)
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """JSON-Antworten wie bisher, mit Zeitmessung der Serialisierung"""
+    def dumps(self, obj, **kwargs):
+        with metrics.stage("json_serialize"):
+            return super().dumps(obj, **kwargs)
 
 app = Flask(__name__)
-app.secret_key = secrets.token_hex(16)
+app.json = TimedJSONProvider(app)
+# Mehrere Worker brauchen denselben Schlüssel, sonst ist das Cookie auf anderen Workern ungültig
+app.secret_key = os.getenv('FLASK_SECRET_KEY') or secrets.token_hex(16)
 app.config["SESSION_PERMANENT"] = False
 
-task_cache = {"test": None, "main": None}
-current_chat_session = None
+def render_task(task):
+    """Fester Teil der Fragenanzeige (Bild und Fragetext); wird beim Laden der Aufgaben einmal pro Aufgabe erzeugt"""
+    lines = []
+    if task.image_file:
+        lines.append(f'<img src="static/img/{task.image_path}.jpg" class="task-img">')
+    lines.append(f"   {task.question}")
+    return lines
+
+# Alle Aufgaben aus data/tasks.csv (wird bei Änderungen der Datei im Hintergrund neu geladen)
+task_bank = TaskBank(os.path.join("data", "tasks.csv"), image_dir=os.path.join("static", "img"), render=render_task)
 
-# Globaler In-Memory Cache für Session-Daten
-app_cache = {
-    'sessions': {},  # session_id -> session_data
-    'lock': threading.RLock()
+def session_evictable(session_id, data):
+    """Darf eine Session bei vollem Speicher-Budget verdrängt werden? (Abgeschlossen oder verlassen;
+    Aufgaben stehen im Event-Log, Ergebnisse im Journal)"""
+    snapshot = data.get("status_snapshot") or {}
+    if snapshot.get("phase") == "summary":
+        return True
+    # Laufende Frist: der Timer braucht die Session noch, um den Timeout zu buchen
+    if timer_engine.deadline(session_id, "answer") is not None:
+        return False
+    return time.time() - data.get("last_access", 0) >= config.SESSION_EVICT_IDLE_SECONDS
+
+def on_session_evicted(session_id, data):
+    drop_chat_session(session_id)
+    timer_engine.cancel(session_id, "idle")
+
+# Session-Daten, die nicht ins Flask-Cookie passen (SESSION_STORE=memory oder sqlite, siehe session_store.py)
+session_store = create_session_store(
+    os.getenv('SESSION_STORE', 'memory'),
+    os.getenv('SESSION_STORE_PATH'),
+    max_bytes=config.SESSION_CACHE_MAX_BYTES,
+    evictable=session_evictable,
+    on_evict=on_session_evicted,
+    poll_interval=config.EVENTS_POLL_SECONDS
+)
+
+# Registry der LLM-Chats pro Session (LRU, session_id -> Chat der aktuellen Aufgabe)
+chat_registry = {
+    'chats': OrderedDict(),  # session_id -> {'chat', 'task_key', 'last_access'}
+    'lock': threading.Lock()
 }
 
+# Begrenzter Thread-Pool für LLM-Aufrufe (Anzahl paralleler + wartender Aufrufe ist beschränkt)
+llm_executor = ThreadPoolExecutor(max_workers=config.LLM_MAX_CONCURRENCY, thread_name_prefix="llm")
+llm_slots = threading.BoundedSemaphore(config.LLM_MAX_CONCURRENCY + config.LLM_QUEUE_DEPTH)
+
+class AssistantBusyError(Exception):
+    """Alle LLM-Slots sind belegt oder die Antwort kam nicht rechtzeitig"""
+
+def submit_llm_call(fn, *args, **kwargs):
+    """Führe einen LLM-Aufruf im Thread-Pool aus; wirft AssistantBusyError, wenn die Warteschlange voll ist"""
+    if not llm_slots.acquire(blocking=False):
+        raise AssistantBusyError(config.ASSISTANT_BUSY_MESSAGE)
+    
+    try:
+        future = llm_executor.submit(fn, *args, **kwargs)
+    except Exception:
+        llm_slots.release()
+        raise
+    
+    future.add_done_callback(lambda _: llm_slots.release())
+    return future
+
+def run_llm_call(fn, *args, **kwargs):
+    """Führe einen LLM-Aufruf im Thread-Pool aus und warte höchstens LLM_TIMEOUT_SECONDS auf das Ergebnis"""
+    future = submit_llm_call(fn, *args, **kwargs)
+    try:
+        return future.result(timeout=config.LLM_TIMEOUT_SECONDS)
+    except FutureTimeoutError:
+        raise AssistantBusyError(config.ASSISTANT_BUSY_MESSAGE)
+
+def new_session_cache():
+    """Leerer Session-Cache für eine neue Session"""
+    return {
+        'lines_left': [],
+        'lines_right': [],
+        'left_seq_start': 0,   # Sequenznummer der ersten Zeile in lines_left
+        'right_seq_start': 0,  # Sequenznummer der ersten Zeile in lines_right
+        'results': [],
+        'record_data': {"records": [], "current_task": None},
+        'current_result': None,
+        'current_options': [],
+        'current_task_key': None,
+        'last_access': time.time()
+    }
+
 def get_session_cache():
-    """Hole Session-Cache für aktuelle Session"""
+    """Hole Session-Cache für aktuelle Session (wird einmal pro Request aus dem Store geladen)"""
     session_id = session.get("session_id")
     if not session_id:
         return {}
     
-    with app_cache['lock']:
-        if session_id not in app_cache['sessions']:
-            app_cache['sessions'][session_id] = {
-                'lines_left': [],
-                'lines_right': [],
-                'results': [],
-                'record_data': {"records": [], "current_task": None},
-                'current_result': None,
-                'current_options': [],
-                'current_task_key': None,
-                'last_access': time.time()
-            }
-        
-        # Update last access time
-        app_cache['sessions'][session_id]['last_access'] = time.time()
-        return app_cache['sessions'][session_id]
+    if g.get("session_cache_id") == session_id:
+        return g.session_cache
+    
+    with metrics.stage("session_load"):
+        cache = session_store.load(session_id)
+    if cache is None:
+        cache = new_session_cache()
+        # Nach einem Neustart: bisherige Aufgaben aus dem Event-Log wiederherstellen
+        restore_task_events(session_id, cache)
+        session_store.save(session_id, cache)
+        # Neue Session: evtl. vorhandenen Chat mit gleicher ID verwerfen
+        drop_chat_session(session_id)
+        timer_engine.schedule(session_id, "idle", cache['last_access'] + config.SESSION_IDLE_SECONDS)
+    else:
+        # Zugriffszeit nur alle SESSION_TOUCH_INTERVAL_SECONDS schreiben statt bei jedem Request
+        now = time.time()
+        if now - cache.get('last_access', 0) >= config.SESSION_TOUCH_INTERVAL_SECONDS:
+            cache['last_access'] = now
+            session_store.touch(session_id, now)
+    
+    g.session_cache_id = session_id
+    g.session_cache = cache
+    g.session_cache_dirty = set()
+    return cache
+
+def mark_session_dirty(*keys):
+    """Merke geänderte Cache-Einträge, damit save_session_cache sie in den Store schreibt"""
+    if g.get("session_cache_id"):
+        g.session_cache_dirty.update(keys)
+
+def save_session_cache():
+    """Schreibe die geänderten Einträge des Session-Caches in den Store"""
+    session_id = g.get("session_cache_id")
+    dirty = g.get("session_cache_dirty")
+    if session_id and dirty:
+        with metrics.stage("session_save"):
+            session_store.save(session_id, g.session_cache, dirty)
+        g.session_cache_dirty = set()
+
+def reload_session_cache():
+    """Lade den Session-Cache neu aus dem Store (z.B. nach einer lang laufenden LLM-Antwort)"""
+    save_session_cache()
+    g.pop("session_cache_id", None)
+    return get_session_cache()
 
 def update_session_cache(updates):
     """Update Session-Cache"""
@@ -64,85 +189,292 @@ def update_session_cache(updates):
     if not session_id:
         return
     
-    with app_cache['lock']:
-        cache = get_session_cache()
-        cache.update(updates)
+    cache = get_session_cache()
+    cache.update(updates)
+    mark_session_dirty(*updates)
 
 def cleanup_old_cache_entries():
-    """Lösche alte Cache-Einträge (älter als 2 Stunden)"""
-    cutoff_time = time.time() - (2 * 60 * 60)
+    """Lösche alte Cache-Einträge (länger als SESSION_IDLE_SECONDS nicht benutzt)"""
+    cutoff_time = time.time() - config.SESSION_IDLE_SECONDS
+    
+    expired_sessions = session_store.expire(cutoff_time)
     
-    with app_cache['lock']:
-        expired_sessions = [
-            sid for sid, data in app_cache['sessions'].items()
-            if data.get('last_access', 0) < cutoff_time
+    for sid in expired_sessions:
+        drop_chat_session(sid)
+    cleanup_chat_sessions()
+
+def get_chat_session(task_key):
+    """Hole den Chat der aktuellen Session, falls er zur aktuellen Aufgabe gehört"""
+    session_id = session.get("session_id")
+    if not session_id or not task_key:
+        return None
+    
+    now = time.time()
+    with chat_registry['lock']:
+        entry = chat_registry['chats'].get(session_id)
+        if entry is None:
+            return None
+        if entry['task_key'] != task_key or now - entry['last_access'] > config.CHAT_SESSION_IDLE_SECONDS:
+            del chat_registry['chats'][session_id]
+            return None
+        
+        entry['last_access'] = now
+        chat_registry['chats'].move_to_end(session_id)
+        return entry['chat']
+
+def register_chat_session(task_key, chat_session):
+    """Registriere den Chat der aktuellen Session für die aktuelle Aufgabe"""
+    session_id = session.get("session_id")
+    if not session_id:
+        return
+    
+    with chat_registry['lock']:
+        chat_registry['chats'][session_id] = {
+            'chat': chat_session,
+            'task_key': task_key,
+            'last_access': time.time()
+        }
+        chat_registry['chats'].move_to_end(session_id)
+        
+        # LRU: älteste Chats verwerfen, wenn das Limit überschritten ist
+        while len(chat_registry['chats']) > config.CHAT_SESSION_MAX_ENTRIES:
+            chat_registry['chats'].popitem(last=False)
+
+def drop_chat_session(session_id=None):
+    """Verwirf den Chat einer Session (Standard: aktuelle Session)"""
+    session_id = session_id or session.get("session_id")
+    if not session_id:
+        return
+    
+    with chat_registry['lock']:
+        chat_registry['chats'].pop(session_id, None)
+
+def cleanup_chat_sessions():
+    """Lösche Chats, die länger als CHAT_SESSION_IDLE_SECONDS nicht benutzt wurden"""
+    cutoff_time = time.time() - config.CHAT_SESSION_IDLE_SECONDS
+    
+    with chat_registry['lock']:
+        expired_chats = [
+            sid for sid, entry in chat_registry['chats'].items()
+            if entry['last_access'] < cutoff_time
         ]
         
-        for sid in expired_sessions:
-            del app_cache['sessions'][sid]
-
-# Periodisches Cleanup
-def schedule_cleanup():
-    cleanup_old_cache_entries()
-    # Schedule next cleanup in 30 minutes
-    timer = threading.Timer(30 * 60, schedule_cleanup)
-    timer.daemon = True
-    timer.start()
-
-# Start cleanup scheduler
-schedule_cleanup()
-
-webdav_options = {
-    'webdav_hostname': os.getenv('SCIEBO_URL'),
-    'webdav_login': os.getenv('SCIEBO_LOGIN'),
-    'webdav_password': os.getenv('SCIEBO_PASSWORD'),
-    'connect_timeout': 10,
-    'read_timeout': 30
+        for sid in expired_chats:
+            del chat_registry['chats'][sid]
+
+def evict_session(session_id):
+    """Entferne eine Session aus Store, Chat-Registry und Timer"""
+    session_store.delete(session_id)
+    drop_chat_session(session_id)
+    timer_engine.cancel(session_id, "answer")
+    timer_engine.cancel(session_id, "idle")
+
+def expire_idle_session(session_id):
+    """Idle-Frist abgelaufen: Session entfernen, falls sie seitdem nicht benutzt wurde"""
+    cache = session_store.load(session_id, ("journaled_events",))
+    if cache is None:
+        drop_chat_session(session_id)
+        return
+
+    idle_until = cache.get('last_access', 0) + config.SESSION_IDLE_SECONDS
+    if idle_until > time.time():
+        timer_engine.schedule(session_id, "idle", idle_until)
+        return
+
+    evict_session(session_id)
+    # Event-Log nur löschen, wenn alle Events im Journal stehen (z.B. nach einem serverseitigen Timeout)
+    journaled_events = cache.get("journaled_events")
+    if journaled_events and task_events.size(session_id) == journaled_events:
+        task_events.delete(session_id)
+
+def session_progress(values):
+    """Stand einer Session (Phase, Aufgabe, Frist), an dem ein veraltetes Cookie erkannt wird"""
+    return [values.get(key) for key in ("phase", "current_phase", "test_idx", "main_idx", "certainty_pending", "deadline")]
+
+def expire_abandoned_session(session_id, deadline):
+    """Der Browser hat eine abgelaufene Frist nicht gemeldet: Timeout buchen und Ergebnisse sichern; der neue Stand
+    wird als server_timeout gespeichert, damit das Cookie bei der Rückkehr nachgezogen statt der Timeout wiederholt wird"""
+    cache = session_store.load(session_id, ("status_snapshot",))
+    snapshot = (cache or {}).get("status_snapshot")
+    if not snapshot or snapshot.get("deadline") is None:
+        return
+    if snapshot["deadline"] + config.TIMER_GRACE_SECONDS != deadline:
+        # Die Frist wurde inzwischen (ggf. von einem anderen Worker) neu gesetzt
+        return
+
+    print(f"Session {session_id} abandoned in phase '{snapshot.get('phase')}' - applying server-side timeout")
+
+    # Dieselbe Logik wie bei einem "timeout" vom Browser, mit dem gespiegelten Session-Zustand
+    with app.test_request_context():
+        session.update(snapshot)
+        if session["phase"] == "questions":
+            handle_timeout()
+        if session_progress(session) != session_progress(snapshot):
+            server_timeout = {"from": session_progress(snapshot), "to": status_snapshot()}
+            update_session_cache({"server_timeout": server_timeout})
+            # Mit dem Ende der Studie wurde das Event-Log schon gelöscht (Ergebnis im Journal)
+            if session["phase"] != "summary":
+                log_task_event("server_timeout", marker=server_timeout)
+        if session["phase"] != "summary":
+            cache = get_session_cache()
+            main_results = [r for r in cache.get('results', []) if r.get("task_type", "main") == "main"]
+            save_results(calculate_stats(main_results))
+        publish_status()
+        save_session_cache()
+
+    # Keine weiteren Fristen, solange der Browser weg ist; die Session läuft über die Idle-Frist ab
+    timer_engine.cancel(session_id, "answer")
+    drop_chat_session(session_id)
+
+def apply_server_timeout():
+    """Hat der Server eine Frist dieser Session gebucht, während der Browser weg war: den dabei erreichten Stand
+    ins Cookie übernehmen (das Cookie zeigt noch auf die bereits gebuchte Aufgabe)"""
+    # Der Server bucht eine Frist erst TIMER_GRACE_SECONDS nach ihrem Ablauf; vorher kann das Cookie nicht
+    # veraltet sein und der Session-Store wird gar nicht erst gelesen
+    deadline = session.get("deadline")
+    if not deadline or time.time() < deadline + config.TIMER_GRACE_SECONDS:
+        return
+    marker = get_session_cache().get("server_timeout")
+    if not marker or session_progress(session) != marker["from"]:
+        return
+    
+    print(f"Session {session['session_id']} returned after a server-side timeout - updating its cookie")
+    session.update(marker["to"])
+    # Ist auch die neue Frist schon abgelaufen, bucht die nächste Eingabe den Timeout (siehe handle_answer)
+    if session.get("deadline") and session["deadline"] > time.time():
+        start_deadline(session["deadline"])
+
+def on_deadline(session_id, kind, deadline):
+    if kind == "idle":
+        expire_idle_session(session_id)
+    else:
+        expire_abandoned_session(session_id, deadline)
+
+# Ein Hintergrund-Thread für alle Fristen (Frage-/Certainty-/Wartezeit und Idle-Ablauf)
+timer_engine = DeadlineScheduler(on_deadline)
+timer_engine.start()
+
+# Reste früherer Prozesse (z.B. in einem geteilten SQLite-Store) einmalig beim Start aufräumen
+cleanup_old_cache_entries()
+
+# Sciebo-Upload mit Keep-Alive-Verbindungen pro Thread (None, wenn SCIEBO_URL fehlt: Ergebnisse bleiben im Spool)
+webdav_client = WebDAVUploader(
+    os.getenv('SCIEBO_URL'),
+    os.getenv('SCIEBO_LOGIN'),
+    os.getenv('SCIEBO_PASSWORD'),
+    max_parallel=config.UPLOAD_MAX_PARALLEL,
+    connect_timeout=10,
+    read_timeout=30
+) if os.getenv('SCIEBO_URL') else None
+
+def upload_result(filename, filepath):
+    """Lade eine Ergebnisdatei nach Sciebo hoch (wird von der Upload-Queue aufgerufen)"""
+    remote_path = os.path.join(os.getenv('SCIEBO_DIRECTORY', ''), filename).replace('\\', '/')
+    with metrics.stage("webdav_upload"):
+        webdav_client.upload_file(remote_path=remote_path, local_path=filepath)
+
+# Event-Log pro Session (Aufgabenstart, Eingaben, Chat, Abschluss), damit nach einem Absturz nichts verloren geht
+task_events = EventLog(os.path.join("results", "events"))
+
+# Lokales Ergebnis-Journal (eine JSON-Zeile pro Teilnehmer); Sciebo ist nur eine Kopie davon
+result_journal = Journal(os.path.join("results", "journal"), "results", config.JOURNAL_MAX_BYTES)
+
+# Ergebnisse werden in results/spool gespeichert und von Hintergrund-Threads hochgeladen;
+# nicht hochgeladene Dateien bleiben dort und werden beim nächsten Start nachgeholt
+result_uploads = UploadQueue(
+    os.path.join("results", "spool"),
+    upload_result,
+    batch_size=config.UPLOAD_BATCH_SIZE,
+    workers=config.UPLOAD_MAX_PARALLEL,
+    retry_base=config.UPLOAD_RETRY_BASE_SECONDS,
+    retry_max=config.UPLOAD_RETRY_MAX_SECONDS
+)
+if webdav_client:
+    result_uploads.start()
+
+# Prozessweiter Cache der zum LLM-Anbieter hochgeladenen Aufgabenbilder
+image_handle_cache = {
+    'handles': {},  # (img_path, sha256) -> {'file', 'expires_at'}
+    'hashes': {},   # img_path -> (mtime, size, sha256)
+    'locks': {},    # img_path -> Lock, damit jedes Bild nur einmal hochgeladen wird
+    'lock': threading.Lock()
 }
 
-webdav_client = Client(webdav_options)
+def get_image_hash(img_path):
+    """Berechne den SHA-256 eines Bildes (nur neu, wenn sich die Datei geändert hat)"""
+    stat = os.stat(img_path)
+    cached = image_handle_cache['hashes'].get(img_path)
+    if cached and cached[0] == stat.st_mtime and cached[1] == stat.st_size:
+        return cached[2]
+    
+    with open(img_path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    image_handle_cache['hashes'][img_path] = (stat.st_mtime, stat.st_size, digest)
+    return digest
 
-def load_tasks():
-    if task_cache["test"] is None or task_cache["main"] is None:
-        test_tasks = []
-        main_tasks = []
+def get_image_handle(img_path):
+    """Gib den beim LLM-Anbieter hochgeladenen File-Handle für ein Bild zurück (Upload nur bei Bedarf)"""
+    with image_handle_cache['lock']:
+        path_lock = image_handle_cache['locks'].setdefault(img_path, threading.Lock())
+    
+    with path_lock:
+        key = (img_path, get_image_hash(img_path))
+        entry = image_handle_cache['handles'].get(key)
+        if entry and time.time() < entry['expires_at'] - config.IMAGE_HANDLE_REFRESH_MARGIN_SECONDS:
+            return entry['file']
         
-        csv_file = os.path.join("data", "tasks.csv")
-        try:
-            with open(csv_file, "r", encoding="utf-8") as f:
-                reader = csv.DictReader(f, delimiter=";")
-                for row in reader:
-                    task = {
-                        "question": row["question"].strip(),
-                        "options": [x.strip() for x in row["options"].split(";")],
-                        "correct_solution": row["correct_solution"].strip(),
-                        "image_path": row.get("image_path", "").strip(),
-                        "task_type": row.get("task_type", "main").strip()
-                    }
-                    if task["correct_solution"] not in task["options"]:
-                        task["options"].append(task["correct_solution"])
-                    
-                    if task["task_type"] == "test":
-                        test_tasks.append(task)
-                    else:
-                        main_tasks.append(task)
-                        
-            random.shuffle(test_tasks)
-            random.shuffle(main_tasks)
-
-            task_cache["test"] = test_tasks[:config.TEST_TASKS_COUNT]
-            task_cache["main"] = main_tasks[:config.MAIN_TASKS_COUNT]
+        with metrics.stage("llm_file_upload"):
+            uploaded_file = llm_provider.upload_file(img_path, "image/jpeg")
+        expires_at = uploaded_file.expires_at or time.time() + config.IMAGE_HANDLE_TTL_SECONDS
+        
+        with image_handle_cache['lock']:
+            # Handles älterer Versionen desselben Bildes verwerfen
+            for old_key in [k for k in image_handle_cache['handles'] if k[0] == img_path]:
+                del image_handle_cache['handles'][old_key]
+            image_handle_cache['handles'][key] = {'file': uploaded_file, 'expires_at': expires_at}
+        
+        return uploaded_file
 
+def warm_image_handles():
+    """Lade alle Bilder aus data/tasks.csv vorab zum LLM-Anbieter hoch"""
+    image_files = {task.image_file for task in list(task_bank.by_id.values())}
+    
+    for img_path in sorted(i for i in image_files if i):
+        try:
+            get_image_handle(img_path)
         except Exception as e:
-            print(f"Error loading tasks: {e}")
-            task_cache["test"] = []
-            task_cache["main"] = []
-            
-    return task_cache
+            print(f"Error uploading image {img_path} during warm-up: {e}")
+
+# Optionales Vorab-Hochladen der Bilder beim Start
+if os.getenv('GEMINI_IMAGE_WARMUP', 'False').lower() == 'true':
+    threading.Thread(target=warm_image_handles, daemon=True).start()
+
+def load_tasks():
+    """Aufgaben der aktuellen Session: pro Session einmal gezogene Stichprobe aus der Task-Bank"""
+    if "tasks" in g:
+        return g.tasks
+    
+    with metrics.stage("task_load"):
+        task_bank.maybe_reload()
+        
+        cache = get_session_cache()
+        task_ids = cache.get("task_ids")
+        if task_ids is None:
+            task_ids = task_bank.sample(session.get("session_id"), {
+                "test": config.TEST_TASKS_COUNT,
+                "main": config.MAIN_TASKS_COUNT
+            })
+            update_session_cache({"task_ids": task_ids})
+        
+        g.tasks = {
+            phase: [task for task in (task_bank.get(task_id) for task_id in ids) if task is not None]
+            for phase, ids in task_ids.items()
+        }
+    return g.tasks
 
 def prepare_options(task):
-    options = task['options'].copy()
-    correct = task['correct_solution']
+    options = task.options.copy()
+    correct = task.correct_solution
     if correct in options:
         options.remove(correct)
     random.shuffle(options)
@@ -171,42 +503,116 @@ def set_prolific_id_once(new_id):
         return True
     return False
 
+SESSION_DEFAULTS = {
+    "phase": "prolific",
+    "test_idx": 0,
+    "main_idx": 0,
+    "start_time": None,
+    "prolific_id": None,
+    "certainty_pending": False,
+    "treatment_group": os.getenv('TREATMENT_GROUP', 'True').lower() == 'true',
+    "current_phase": "test",
+    "waiting_start_time": None,
+    "session_id": None,
+    "is_first_message": False,
+    "deadline": None
+}
+
 def init_session():
-    defaults = {
-        "phase": "prolific",
-        "test_idx": 0,
-        "main_idx": 0,
-        "start_time": None,
-        "prolific_id": None,
-        "certainty_pending": False,
-        "treatment_group": os.getenv('TREATMENT_GROUP', 'True').lower() == 'true',
-        "current_phase": "test",
-        "waiting_start_time": None,
-        "session_id": secrets.token_hex(16),
-        "is_first_message": False
-    }
+    """Fehlende Werte der Flask Session setzen (nur bei neuen Sessions bzw. Cookies älterer Versionen)"""
+    if SESSION_DEFAULTS.keys() <= session.keys():
+        return
     
     # Nur kleine Daten in Flask Session - ABER niemals prolific_id überschreiben
-    for key, value in defaults.items():
+    for key, value in SESSION_DEFAULTS.items():
         if key not in session:
-            session[key] = value
-        elif key == "prolific_id" and session.get("prolific_id") is not None:
-            # NIEMALS die Prolific ID überschreiben wenn sie bereits gesetzt ist
-            pass
+            session[key] = secrets.token_hex(16) if key == "session_id" else value
     
-    # Große Daten im App-Cache initialisieren
-    get_session_cache()  # This creates the cache entry if it doesn't exist
+    # Große Daten im App-Cache werden beim ersten Zugriff (get_session_cache) angelegt
+
+def clear_left():
+    # Die Sequenznummer springt über das Ende hinaus, damit Clients den Reset erkennen
+    cache = get_session_cache()
+    update_session_cache({
+        "lines_left": [],
+        "left_seq_start": cache.get("left_seq_start", 0) + len(cache.get("lines_left", [])) + 1
+    })
+
+def clear_right():
+    cache = get_session_cache()
+    update_session_cache({
+        "lines_right": [],
+        "right_seq_start": cache.get("right_seq_start", 0) + len(cache.get("lines_right", [])) + 1
+    })
 
 def clear_console():
-    update_session_cache({"lines_left": [], "lines_right": []})
+    clear_left()
+    clear_right()
+
+def console_lines(side, cache=None, start=0):
+    """HTML-Zeilen einer Konsole ab Index start; Chat-Nachrichten rechts werden aus dem Chat-Verlauf der aktuellen Task erzeugt"""
+    cache = cache if cache is not None else get_session_cache()
+    lines = cache.get(f"lines_{side}", [])
+    if start:
+        lines = lines[start:]
+    if side == "left" or all(isinstance(line, str) for line in lines):
+        return lines
+    
+    current = (cache.get("record_data") or {}).get("current_task")
+    chat_history = current.chat_history if current else []
+    return [
+        line if isinstance(line, str) else
+        format_chat_message(chat_history[line]) if line < len(chat_history) else ""
+        for line in lines
+    ]
+
+def console_delta(side, since, cache=None):
+    """Zeilen einer Konsole ('left'/'right') seit Sequenznummer since; nach clear_console alle Zeilen mit reset"""
+    cache = cache if cache is not None else get_session_cache()
+    start = cache.get(f"{side}_seq_start", 0)
+    end = start + len(cache.get(f"lines_{side}", []))
+
+    if since is None or since < start or since > end:
+        return {"seq": end, "reset": True, "lines": console_lines(side, cache)}
+    return {"seq": end, "reset": False, "lines": console_lines(side, cache, since - start)}
+
+def get_client_seq(side):
+    """Letzte vom Client gesehene Sequenznummer (Query-Parameter oder JSON-Body), sonst None"""
+    value = request.args.get(f"{side}_seq")
+    if value is None and request.is_json:
+        value = (request.get_json(silent=True) or {}).get(f"{side}_seq")
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def console_payload(left=False, right=False):
+    """Konsoleninhalt für eine Antwort: nur neue Zeilen, wenn der Client Sequenznummern schickt, sonst alles"""
+    payload = {}
+    for side, wanted in (("left", left), ("right", right)):
+        if not wanted:
+            continue
+        since = get_client_seq(side)
+        if since is None:
+            payload[f"lines_{side}"] = console_lines(side)
+        else:
+            payload[side] = console_delta(side, since)
+    return payload
 
 def append_left(txt):
     cache = get_session_cache()
     cache['lines_left'].append(txt)
+    mark_session_dirty('lines_left')
+
+def extend_left(lines):
+    cache = get_session_cache()
+    cache['lines_left'].extend(lines)
+    mark_session_dirty('lines_left')
 
 def append_right(txt):
     cache = get_session_cache()
     cache['lines_right'].append(txt)
+    mark_session_dirty('lines_right')
 
 def get_current_task():
     tasks = load_tasks()
@@ -223,15 +629,23 @@ def is_phase_complete():
     idx = session["test_idx"] if phase == "test" else session["main_idx"]
     return idx >= len(tasks[phase])
 
+def start_deadline(deadline):
+    """Setze die Frist der aktuellen Frage/Phase und plane den serverseitigen Timeout"""
+    session["deadline"] = deadline
+    timer_engine.schedule(session["session_id"], "answer", deadline + config.TIMER_GRACE_SECONDS)
+
+def clear_deadline():
+    session["deadline"] = None
+    timer_engine.cancel(session["session_id"], "answer")
+
 def show_question():
-    global current_chat_session
-    
     clear_console()
     session["start_time"] = time.time()
+    start_deadline(session["start_time"] + config.QUESTION_TIME_SECONDS)
     
     # Clear chat history for new question
-    update_session_cache({"lines_right": []})
-    current_chat_session = None
+    clear_right()
+    drop_chat_session()
     session["is_first_message"] = False
     
     if is_phase_complete():
@@ -250,24 +664,18 @@ def show_question():
     # Store current task key in cache
     update_session_cache({"current_task_key": f"{phase}_{idx}"})
     
-    append_left(f"$  {prefix} {idx+1}/{total}\n")
-    
-    if task.get("image_path"):
-        img_path = os.path.join("static", "img", task["image_path"] + ".jpg")
-        if os.path.exists(img_path):
-            append_left(f'<img src="static/img/{task["image_path"]}.jpg" class="task-img">')
-    
-    append_left(f"   {task['question']}")
+    # Bild und Fragetext kommen vorgerendert aus der Task-Bank, nur die gemischten Optionen sind pro Teilnehmer
+    lines = [f"$  {prefix} {idx+1}/{total}\n"]
+    lines.extend(task_bank.fragments(task))
     
     options = prepare_options(task)
     update_session_cache({"current_options": options})
     
     start_task_record(idx, task, options, phase)
     
-    for x, op in enumerate(options):
-        append_left(f"   {chr(ord('a') + x)}) {op}")
-    
-    append_left("$  Type a letter and press ENTER.")
+    lines.extend(f"   {chr(ord('a') + x)}) {op}" for x, op in enumerate(options))
+    lines.append("$  Type a letter and press ENTER.")
+    extend_left(lines)
     
     fixed_greeting = "<span class='assistant'>Assistant: Hello! I'm your mathematical assistant. I'm ready to help you with this math problem.</span>"
     append_right(fixed_greeting)
@@ -278,6 +686,7 @@ def handle_phase_completion():
     if phase == "test":
         session["phase"] = "waiting"
         session["waiting_start_time"] = time.time()
+        start_deadline(session["waiting_start_time"] + config.WAITING_TIME_SECONDS)
         clear_console()
         
         append_left("$  Practice Phase Completed!")
@@ -288,6 +697,7 @@ def handle_phase_completion():
         append_left(f"$  Please wait {config.WAITING_TIME_SECONDS} seconds...")
     else:
         session["phase"] = "summary"
+        clear_deadline()
         clear_console()
         show_summary()
 
@@ -351,79 +761,168 @@ def generate_summary_footer(stats):
     Average certainty: {stats['avg_certainty']:.2f}
     Group: {"treatment" if session["treatment_group"] else "control"}"""
 
+def log_task_event(event_type, **data):
+    """Schreibe ein Aufgaben-Event ins Event-Log der Session; False, wenn das nicht möglich war"""
+    try:
+        task_events.append(session["session_id"], {"type": event_type, "timestamp": time.time(), **data})
+        return True
+    except Exception as e:
+        print(f"Error writing task event '{event_type}': {e}")
+        return False
+
+def replay_task_events(events):
+    """Baue records, current_task, results und das Ergebnis einer noch nicht bewerteten Antwort
+    (wartet auf die Certainty-Frage) aus den Events einer Session wieder auf"""
+    records = []
+    current = None
+    results = []
+    pending_result = None
+    for event in events:
+        if event["type"] == "start":
+            current = TaskRecord.from_json(event["task"])
+            pending_result = None
+        elif current is None:
+            continue
+        elif event["type"] == "answer":
+            pending_result = event["result"]
+        elif event["type"] == "input":
+            current.user_inputs.append(UserInput.from_json(event["input"]))
+        elif event["type"] == "chat":
+            current.chat_history.extend(ChatTurn.from_json(m) for m in event["messages"])
+        elif event["type"] == "complete":
+            outcome = event["outcome"]
+            current.final_answer = outcome["final_answer"]
+            current.certainty = outcome["certainty"]
+            current.time_spent = outcome["time_spent"]
+            records.append(current)
+            if event.get("result"):
+                results.append(event["result"])
+            current = None
+            pending_result = None
+    return records, current, results, pending_result
+
+def restore_task_events(session_id, cache):
+    """Stelle record_data und results einer Session aus dem Event-Log wieder her (nach einem Neustart)"""
+    try:
+        events = task_events.events(session_id)
+        records, current, results, pending_result = replay_task_events(events)
+    except Exception as e:
+        print(f"Error restoring session {session_id} from event log: {e}")
+        return
+    server_timeout = next((e["marker"] for e in reversed(events) if e["type"] == "server_timeout"), None)
+    if server_timeout:
+        cache['server_timeout'] = server_timeout
+    if not records and current is None:
+        return
+    
+    print(f"Restored session {session_id} from event log ({len(records)} completed tasks)")
+    if current:
+        current.logged = True
+    cache['record_data'] = {
+        "records": [r.compact() for r in records],
+        "current_task": current
+    }
+    cache['results'] = results
+    if current:
+        cache['current_options'] = current.options
+        cache['current_task_key'] = f"{current.task_type}_{current.task_index}"
+        cache['current_result'] = pending_result
+
 def start_task_record(task_idx, task, options, task_type):
     cache = get_session_cache()
     record_data = cache.get('record_data', {"records": [], "current_task": None})
-    record_data["current_task"] = {
-        "task_index": task_idx,
-        "question": task["question"],
-        "options": options,
-        "solution": task["correct_solution"],
-        "user_inputs": [],
-        "time_spent": 0,
-        "final_answer": None,
-        "certainty": None,
-        "task_type": task_type,
-        "chat_history": []
-    }
+    current = TaskRecord(task_idx, task.question, options, task.correct_solution, task_type)
+    current.logged = log_task_event("start", task=current.to_json())
+    record_data["current_task"] = current
     update_session_cache({"record_data": record_data})
 
-def add_chat_interaction(user_msg, assistant_msg):
+def format_chat_message(turn):
+    """HTML-Zeile der rechten Konsole für einen Eintrag im Chat-Verlauf"""
+    if turn.role == "user":
+        return f"<span class='user'>You: {turn.message}</span>"
+    return f"<span class='assistant'>Assistant: {turn.message}</span>"
+
+def add_chat_message(role, message):
+    """Speichere eine Chat-Nachricht in der aktuellen Task und zeige sie rechts an; gibt die HTML-Zeile zurück"""
     cache = get_session_cache()
     record_data = cache.get('record_data', {"records": [], "current_task": None})
-    if record_data.get("current_task"):
-        record_data["current_task"]["chat_history"].append({
-            "timestamp": time.time(),
-            "role": "user",
-            "message": user_msg
-        })
-        record_data["current_task"]["chat_history"].append({
-            "timestamp": time.time(),
-            "role": "assistant", 
-            "message": assistant_msg
-        })
-        update_session_cache({"record_data": record_data})
+    turn = ChatTurn(time.time(), role, message)
+    current = record_data.get("current_task")
+    if not current:
+        append_right(format_chat_message(turn))
+        return format_chat_message(turn)
+    
+    current.chat_history.append(turn)
+    if not log_task_event("chat", messages=[turn.to_json()]):
+        current.logged = False
+    update_session_cache({"record_data": record_data})
+    
+    # Der Text steht nur im Chat-Verlauf; die rechte Konsole speichert den Index des Eintrags
+    append_right(len(current.chat_history) - 1)
+    return format_chat_message(turn)
 
 def add_user_input(input_text, input_type="answer"):
     """Speichere User-Input in der aktuellen Task"""
     cache = get_session_cache()
     record_data = cache.get('record_data', {"records": [], "current_task": None})
-    if record_data.get("current_task"):
-        record_data["current_task"]["user_inputs"].append({
-            "timestamp": time.time(),
-            "input": input_text,
-            "type": input_type
-        })
+    current = record_data.get("current_task")
+    if current:
+        user_input = UserInput(time.time(), input_text, input_type)
+        current.user_inputs.append(user_input)
+        if not log_task_event("input", input=user_input.to_json()):
+            current.logged = False
         update_session_cache({"record_data": record_data})
 
-def complete_task(answer, certainty, time_spent):
+def complete_task(answer, certainty, time_spent, result=None):
     cache = get_session_cache()
     record_data = cache.get('record_data', {"records": [], "current_task": None})
-    if record_data.get("current_task"):
-        current = record_data["current_task"]
-        current.update({
+    current = record_data.get("current_task")
+    if current:
+        current.final_answer = answer
+        current.certainty = certainty
+        current.time_spent = time_spent
+        outcome = {
             "final_answer": answer,
             "certainty": certainty,
             "time_spent": time_spent
-        })
+        }
+        logged = log_task_event("complete", outcome=outcome, result=result)
+        # Chat-Verlauf und Eingaben stehen im Event-Log und werden erst in save_results wieder geladen
+        if logged and current.logged:
+            current = current.compact()
+        else:
+            current.logged = False
         record_data["records"].append(current)
         record_data["current_task"] = None
         update_session_cache({"record_data": record_data})
 
+def full_task_records(record_data):
+    """Abgeschlossene Aufgaben mit Chat-Verlauf und Eingaben aus dem Event-Log"""
+    records = record_data["records"]
+    if not any(r.logged for r in records):
+        return records
+    
+    logged_records, _, _, _ = replay_task_events(task_events.events(session["session_id"]))
+    by_task = {(r.task_type, r.task_index): r for r in logged_records}
+    return [
+        by_task.get((r.task_type, r.task_index), r) if r.logged else r
+        for r in records
+    ]
+
 def save_results(stats):
     cache = get_session_cache()
     record_data = cache.get('record_data', {"records": [], "current_task": None})
+    # Alles, was bis hier ins Event-Log geschrieben wurde, steht danach im Journal
+    journaled_events = task_events.size(session["session_id"])
+    try:
+        records = full_task_records(record_data)
+    except Exception as e:
+        print(f"Error reading task event log: {e}")
+        records = record_data["records"]
     
     # Use protected Prolific ID function
     prolific_id = get_protected_prolific_id()
     
-    # EXTENSIVE LOGGING to track the prolific_id issue
-    print(f"=== SAVE_RESULTS DEBUG ===")
-    print(f"session.get('prolific_id'): '{session.get('prolific_id', 'NONE')}'")
-    print(f"get_protected_prolific_id(): '{prolific_id}'")
-    print(f"session contents: {dict(session)}")
-    print(f"=========================")
-    
     if not prolific_id:
         print(f"ERROR: No valid prolific_id found in save_results. Session prolific_id: '{session.get('prolific_id', 'NONE')}'")
         prolific_id = "INVALID_PROLIFIC_ID"
@@ -434,67 +933,33 @@ def save_results(stats):
         "group": "treatment" if session["treatment_group"] else "control",
         "statistics": stats,
         "timestamp": time.time(),
-        "test_tasks": [r for r in record_data["records"] if r["task_type"] == "test"],
-        "main_tasks": [r for r in record_data["records"] if r["task_type"] == "main"],
+        "test_tasks": [r.to_json() for r in records if r.task_type == "test"],
+        "main_tasks": [r.to_json() for r in records if r.task_type == "main"],
     }
     
+    filename = f'results_{prolific_id}.json'
+    print(f"Saving results to: {filename} with prolific_id: {prolific_id}")
+    
+    # Erst ins Journal (bleibt lokal erhalten), dann asynchroner Upload zu Sciebo über die Upload-Queue
     try:
-        filename = f'results_{prolific_id}.json'
-        filepath = os.path.join("results", filename)
-        
-        print(f"Saving results to: {filename} with prolific_id: {prolific_id}")
-        
-        os.makedirs("results", exist_ok=True)
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(final_data, f, ensure_ascii=False, indent=2)
-
-        # Asynchroner Upload zu Sciebo
-        if webdav_client:
-            upload_to_sciebo_async(filepath, filename)
-        
+        with metrics.stage("result_journal"):
+            result_journal.append(final_data)
+        release_task_events(journaled_events)
     except Exception as e:
-        print(f"Error saving results: {e}")
-        
+        print(f"Error writing results journal: {e}")
+    
+    try:
+        result_uploads.enqueue(filename, final_data)
     except Exception as e:
         print(f"Error saving results: {e}")
 
-def upload_to_sciebo_async(filepath, filename):
-    """Asynchrone Upload-Funktion für Sciebo"""
-    def upload_worker():
-        if not webdav_client:
-            return
-            
-        remote_path = os.path.join(os.getenv('SCIEBO_DIRECTORY', ''), filename).replace('\\', '/')
-        
-        for attempt in range(3):
-            try:
-                webdav_client.upload_file(remote_path=remote_path, local_path=filepath)
-                # Datei nur löschen wenn Upload erfolgreich war
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-                print(f"Successfully uploaded {filename} to Sciebo")
-                return
-            except Exception as e:
-                print(f"Upload attempt {attempt + 1} failed: {e}")
-                if attempt < 2:
-                    time.sleep(2)
-        
-        # Falls alle Upload-Versuche fehlschlagen, Backup erstellen
-        backup_path = filepath.replace(".json", f"_backup_{int(time.time())}.json")
-        try:
-            shutil.copy(filepath, backup_path)
-            print(f"Created backup: {backup_path}")
-        except Exception as e:
-            print(f"Failed to create backup: {e}")
-    
-    # Upload in separatem Thread starten
-    upload_thread = threading.Thread(target=upload_worker, daemon=True)
-    upload_thread.start()
-
-def upload_to_sciebo(filepath, filename):
-    """Synchrone Upload-Funktion (Legacy) - wird durch asynchrone Version ersetzt"""
-    upload_to_sciebo_async(filepath, filename)
+def release_task_events(journaled_events):
+    """Das Ergebnis steht im Journal: am Ende der Studie das Event-Log löschen, sonst dessen Größe merken
+    (expire_idle_session löscht das Log, wenn danach keine Events mehr dazukamen)"""
+    if session["phase"] == "summary":
+        task_events.delete(session["session_id"])
+    else:
+        update_session_cache({"journaled_events": journaled_events})
 
 def handle_input(user_input):
     if session["phase"] == "prolific":
@@ -544,11 +1009,11 @@ def handle_answer(user_input):
     if not task:
         return
     
-    spent = time.time() - session["start_time"] if session["start_time"] else 0
-    
-    if spent >= config.QUESTION_TIME_SECONDS:
+    if session.get("deadline") and time.time() >= session["deadline"]:
         handle_timeout()
         return
+
+    spent = time.time() - session["start_time"] if session["start_time"] else 0
     
     cache = get_session_cache()
     current_options = cache.get('current_options', [])
@@ -563,21 +1028,23 @@ def handle_answer(user_input):
         return
         
     chosen = current_options[answer_idx]
-    correct = (chosen == task["correct_solution"])
+    correct = (chosen == task.correct_solution)
 
     # Speichere die User-Antwort
     add_user_input(user_input.upper(), "answer")
 
     current_result = {
-        "question": task["question"],
+        "question": task.question,
         "chosen_option": chosen,
-        "correct_option": task["correct_solution"],
+        "correct_option": task.correct_solution,
         "is_correct": correct,
         "time_spent": spent,
         "task_type": session["current_phase"]
     }
     
     update_session_cache({"current_result": current_result})
+    # Gebucht wird die Antwort erst mit der Certainty; bis dahin muss sie einen Neustart im Event-Log überstehen
+    log_task_event("answer", result=current_result)
     
     ask_certainty()
 
@@ -601,7 +1068,8 @@ def handle_timeout():
             complete_task(
                 current_result["chosen_option"],
                 0,
-                current_result["time_spent"]
+                current_result["time_spent"],
+                result=current_result
             )
             
             update_session_cache({"current_result": None})
@@ -609,7 +1077,7 @@ def handle_timeout():
             
             append_left("$  TIME'S UP! Moving to next question...")
             
-            update_session_cache({"lines_right": []})
+            clear_right()
             
             advance_question()
             return
@@ -619,9 +1087,9 @@ def handle_timeout():
     add_user_input("timeout", "timeout_answer")
     
     current_result = {
-        "question": task["question"],
+        "question": task.question,
         "chosen_option": "TIMEOUT",
-        "correct_option": task["correct_solution"],
+        "correct_option": task.correct_solution,
         "is_correct": False,
         "time_spent": config.QUESTION_TIME_SECONDS,
         "certainty": 0,  # Set certainty to 0 for timeout
@@ -635,19 +1103,21 @@ def handle_timeout():
     complete_task(
         "TIMEOUT",
         0,
-        config.QUESTION_TIME_SECONDS
+        config.QUESTION_TIME_SECONDS,
+        result=current_result
     )
     
     append_left("$  TIME'S UP! Moving to next question...")
     
     update_session_cache({"current_result": None})
     session["certainty_pending"] = False
-    update_session_cache({"lines_right": []})
+    clear_right()
     
     advance_question()
 
 def ask_certainty():
     session["certainty_pending"] = True
+    start_deadline(time.time() + config.CERTAINTY_TIME_SECONDS)
     
     cache = get_session_cache()
     current_result = cache.get('current_result', {})
@@ -695,7 +1165,8 @@ def handle_certainty(user_input):
         complete_task(
             current_result["chosen_option"],
             certainty,
-            current_result["time_spent"]
+            current_result["time_spent"],
+            result=current_result
         )
         
         update_session_cache({"current_result": None})
@@ -704,8 +1175,6 @@ def handle_certainty(user_input):
     advance_question()
 
 def advance_question():
-    global current_chat_session
-    
     phase = session["current_phase"]
     
     if phase == "test":
@@ -713,9 +1182,9 @@ def advance_question():
     else:
         session["main_idx"] += 1
     
-    update_session_cache({"lines_right": []})
+    clear_right()
     update_session_cache({"current_task_key": None})
-    current_chat_session = None
+    drop_chat_session()
     session["is_first_message"] = False
     
     if is_phase_complete():
@@ -723,11 +1192,45 @@ def advance_question():
     else:
         show_question()
 
+# Endpunkte ohne Session und Aufgaben
+SESSIONLESS_ENDPOINTS = ("static", "metrics_endpoint")
+
 @app.before_request
 def before_request():
-    session.permanent = False
-    init_session()
-    load_tasks()
+    if request.endpoint in SESSIONLESS_ENDPOINTS:
+        return
+    if metrics.enabled:
+        metrics.begin_request()
+    with metrics.stage("before_request"):
+        # Nur setzen, wenn nötig - jede Zuweisung erzwingt ein neues Session-Cookie
+        if session.permanent:
+            session.permanent = False
+        init_session()
+        apply_server_timeout()
+
+@app.after_request
+def after_request(response):
+    if request.endpoint in SESSIONLESS_ENDPOINTS:
+        return response
+    publish_status()
+    save_session_cache()
+    if metrics.enabled:
+        metrics.end_request(request.endpoint, request.method, request.path, response.status_code)
+    return response
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Zeitmessungen und Zustand des Session-Stores im Prometheus-Textformat (nur mit METRICS_ENABLED)"""
+    if not metrics.enabled:
+        return "Metrics are disabled", 404
+    store_stats = session_store.stats()
+    gauges = {
+        "lcode_session_store": ("Session store counters and size", {
+            (("stat", key),): value for key, value in store_stats.items() if isinstance(value, (int, float))
+        }),
+        "lcode_upload_queue_pending": ("Result files waiting for upload", {(): len(result_uploads.pending())}),
+    }
+    return Response(metrics.render(gauges), mimetype="text/plain; version=0.0.4")
 
 @app.route("/")
 def home():
@@ -755,46 +1258,131 @@ def home():
         append_left("$")
         append_left("$  Please enter your Prolific ID to begin:")
         
-    return render_template("console.html", 
-                         lines_left=cache.get("lines_left", []), 
-                         lines_right=cache.get("lines_right", []),
-                         session=session)
+    return render_template("console.html",
+                         lines_left=cache.get("lines_left", []),
+                         lines_right=console_lines("right", cache),
+                         left_seq=console_delta("left", None)["seq"],
+                         right_seq=console_delta("right", None)["seq"],
+                         session=session,
+                         chat_streaming=config.CHAT_STREAMING)
 
-@app.route("/status")
-def status():
+def status_snapshot():
+    """Kopie der Flask-Session (Phase, Fortschritt, Frist, Prolific ID, ...)"""
+    return {key: value for key, value in session.items() if not key.startswith("_")}
+
+def publish_status():
+    """Spiegle die Flask-Session in den Session-Cache, damit /events und der Timer-Thread sie ohne Cookie lesen können"""
+    if not session.get("session_id"):
+        return
+    snapshot = status_snapshot()
+    if get_session_cache().get("status_snapshot") != snapshot:
+        update_session_cache({"status_snapshot": snapshot})
+
+def compute_status(snapshot):
+    """Timer- und Phasenstatus aus einem status_snapshot"""
     timer_duration = 0
     should_reset = False
-    
-    if session["phase"] == "questions":
-        if not session["certainty_pending"]:
-            # Calculate remaining time for main question
-            if session.get("start_time"):
-                elapsed = time.time() - session["start_time"]
-                remaining = max(0, config.QUESTION_TIME_SECONDS - elapsed)
-                timer_duration = remaining / 60
-            else:
-                timer_duration = config.QUESTION_TIME_SECONDS / 60
+    waiting_over = False
+
+    # Restzeit bis zur Frist der aktuellen Frage/Certainty-Frage/Wartezeit
+    deadline = snapshot.get("deadline")
+    remaining = max(0, deadline - time.time()) if deadline else None
+
+    if snapshot["phase"] == "questions":
+        if not snapshot["certainty_pending"]:
+            timer_duration = (remaining if remaining is not None else config.QUESTION_TIME_SECONDS) / 60
         else:
-            # For certainty questions, use a fixed short timer
-            timer_duration = config.CERTAINTY_TIME_SECONDS / 60
-    elif session["phase"] == "waiting":
-        elapsed = time.time() - session["waiting_start_time"] if session["waiting_start_time"] else 0
-        remaining = max(0, config.WAITING_TIME_SECONDS - elapsed)
+            timer_duration = (remaining if remaining is not None else config.CERTAINTY_TIME_SECONDS) / 60
+    elif snapshot["phase"] == "waiting":
+        remaining = remaining if remaining is not None else 0
         timer_duration = remaining / 60
         should_reset = True
-    
-    cache = get_session_cache()
-    
-    return jsonify({
+        waiting_over = remaining <= 0
+
+    return {
         "timer_duration": timer_duration,
         "should_reset": should_reset,
-        "question_idx": session["test_idx"] if session["current_phase"] == "test" else session["main_idx"],
-        "certainty_pending": session.get("certainty_pending", False),
-        "phase": session["phase"],
-        "waiting_phase": session["phase"] == "waiting",
-        "lines_right": cache.get("lines_right", [])
+        "question_idx": snapshot["test_idx"] if snapshot["current_phase"] == "test" else snapshot["main_idx"],
+        "certainty_pending": snapshot.get("certainty_pending") or False,
+        "phase": snapshot["phase"],
+        "waiting_phase": snapshot["phase"] == "waiting",
+        "waiting_over": waiting_over
+    }
+
+@app.route("/status")
+def status():
+    return jsonify({
+        **compute_status(status_snapshot()),
+        **console_payload(right=True)
     })
 
+# Jeder offene /events-Stream belegt einen Worker-Thread; darüber hinaus fallen Browser auf Polling zurück
+events_slots = threading.BoundedSemaphore(config.EVENTS_MAX_STREAMS)
+
+@app.route("/events")
+def events():
+    """Server-Sent Events mit Phasen-/Timer-Änderungen und neuen Zeilen der rechten Konsole (ersetzt das Polling von /status)"""
+    if not events_slots.acquire(blocking=False):
+        # 204 beendet die automatische Wiederverbindung des Browsers
+        return Response(status=204)
+
+    session_id = session["session_id"]
+    right_seq = get_client_seq("right")
+
+    def generate():
+        last_status = None
+        last_right_seq = right_seq
+        last_sent = time.time()
+        stream_end = time.time() + config.EVENTS_MAX_SECONDS
+        snapshot = None
+        loaded_version = None
+
+        yield f"retry: {config.EVENTS_RETRY_MS}\n\n"
+
+        version = session_store.version(session_id)
+        while version is not None and time.time() < stream_end:
+            # Session nur nach einer Änderung neu laden (der Store weckt nur die Streams dieser Session)
+            if version != loaded_version:
+                cache = session_store.load(session_id, ("status_snapshot", "lines_right", "right_seq_start", "record_data"))
+                if cache is None:
+                    break
+                loaded_version = version
+                snapshot = cache.get("status_snapshot")
+
+                delta = console_delta("right", last_right_seq, cache)
+                if delta["seq"] != last_right_seq or delta["reset"]:
+                    last_right_seq = delta["seq"]
+                    last_sent = time.time()
+                    yield sse_event("right", delta)
+
+            wait_seconds = stream_end - time.time()
+            if snapshot:
+                status_data = compute_status(snapshot)
+                status_key = (json.dumps(snapshot, sort_keys=True), status_data["waiting_over"])
+                if status_key != last_status:
+                    last_status = status_key
+                    last_sent = time.time()
+                    yield sse_event("status", status_data)
+
+                # Genau zum Ende der Wartezeit aufwachen
+                if status_data["waiting_phase"] and not status_data["waiting_over"]:
+                    wait_seconds = min(wait_seconds, status_data["timer_duration"] * 60 + 0.05)
+
+            if time.time() - last_sent >= config.EVENTS_HEARTBEAT_SECONDS:
+                last_sent = time.time()
+                yield ": keepalive\n\n"
+            wait_seconds = min(wait_seconds, last_sent + config.EVENTS_HEARTBEAT_SECONDS - time.time())
+
+            version = session_store.wait_changed(session_id, version, max(0, wait_seconds))
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    response.call_on_close(events_slots.release)
+    return response
+
 @app.route("/command", methods=["POST"])
 def command():
     try:
@@ -827,35 +1415,18 @@ def command():
                        (previous_main_idx != current_main_idx and current_phase == "main") or
                        previous_phase != current_phase) and not session.get("certainty_pending", False)
         
-        timer_duration = 0
-        should_reset = False
-        
+        status_data = compute_status(status_snapshot())
+        timer_duration = status_data["timer_duration"]
+        should_reset = status_data["should_reset"]
+
         if session["phase"] == "questions":
-            current_certainty_pending = session.get("certainty_pending", False)
-            
-            if not current_certainty_pending:
-                # Calculate remaining time for main question
-                if session.get("start_time"):
-                    elapsed = time.time() - session["start_time"]
-                    remaining = max(0, config.QUESTION_TIME_SECONDS - elapsed)
-                    timer_duration = remaining / 60
-                else:
-                    timer_duration = config.QUESTION_TIME_SECONDS / 60
+            if not session.get("certainty_pending", False):
                 should_reset = was_certainty_pending or processed_input == "timeout" or new_question
             else:
-                timer_duration = config.CERTAINTY_TIME_SECONDS / 60
                 should_reset = (not was_certainty_pending) or processed_input == "timeout"
-        elif session["phase"] == "waiting":
-            elapsed = time.time() - session["waiting_start_time"] if session["waiting_start_time"] else 0
-            remaining = max(0, config.WAITING_TIME_SECONDS - elapsed)
-            timer_duration = remaining / 60
-            should_reset = True
-        
-        cache = get_session_cache()
         
         return jsonify({
-            "lines_left": cache.get("lines_left", []),
-            "lines_right": cache.get("lines_right", []),
+            **console_payload(left=True, right=True),
             "timer_duration": timer_duration,
             "should_reset": should_reset,
             "certainty_pending": session.get("certainty_pending", False),
@@ -866,97 +1437,188 @@ def command():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def check_chat_request():
+    """Prüfe eine Chat-Anfrage und füge die Nachricht rechts an; gibt (message, task_key, error_response) zurück"""
+    if (session["phase"] != "questions" or 
+        session["phase"] == "waiting"):
+        return None, None, jsonify({
+            **console_payload(right=True),
+            "error": "Chat not available"
+        })
+    
+    message = request.json.get("message", "").strip()
+    if not message:
+        return None, None, jsonify({**console_payload(right=True), "error": "Empty message"})
+    
+    add_chat_message("user", message)
+    
+    cache = get_session_cache()
+    task_key = cache.get("current_task_key")
+    if not task_key:
+        return None, None, jsonify({"error": "No active task", **console_payload(right=True)})
+    
+    return message, task_key, None
+
+def first_message_contents(task, message):
+    """Inhalt der ersten Nachricht zu einer Aufgabe: Bild, Fragetext und Nachricht"""
+    contents = []
+    
+    if task and task.image_file:
+        try:
+            contents.append(get_image_handle(task.image_file))
+        except Exception as e:
+            print(f"Error uploading image {task.image_file}: {e}")
+    
+    contents.append(f"Current math question: {task.question}")
+    contents.append(f"User message: {message}")
+    return contents
+
+def chat_history_turns(task):
+    """Bisherige Chat-Runden der aktuellen Aufgabe als (Inhalt der Nachricht, Antwort) aus dem Session-Cache;
+    Nachrichten ohne Antwort (Assistent ausgelastet, gerade gesendete Nachricht) kennt auch der Chat nicht"""
+    current = (get_session_cache().get("record_data") or {}).get("current_task")
+    turns = []
+    user_message = None
+    for turn in (current.chat_history if current else []):
+        if turn.role == "user":
+            user_message = turn.message
+        elif user_message is not None:
+            contents = [f"User message: {user_message}"] if turns else first_message_contents(task, user_message)
+            turns.append((contents, turn.message))
+            user_message = None
+    return turns
+
+def open_chat_turn(message, task_key):
+    """Hole den Chat der Aufgabe (oder lege ihn an) und baue den Inhalt der Nachricht; gibt (chat, contents, is_new_chat) zurück"""
+    chat_session = get_chat_session(task_key)
+    if chat_session is not None:
+        return chat_session, [f"User message: {message}"], False
+    
+    # Der Chat liegt nur in der Registry des Prozesses, der ihn angelegt hat: fehlt er hier (anderer Worker,
+    # verdrängt, Neustart), wird er aus dem Chat-Verlauf im Session-Store wieder aufgebaut
+    task = get_current_task()
+    history = chat_history_turns(task)
+    system_prompt = config.TREATMENT_GROUP_PROMPT if session["treatment_group"] else config.CONTROL_GROUP_PROMPT
+    chat_session = llm_provider.create_chat(LLM_MODEL, system_prompt, temperature=0, max_output_tokens=2000,
+                                            history=history)
+    
+    if history:
+        return chat_session, [f"User message: {message}"], True
+    
+    # Erste Nachricht zu dieser Aufgabe
+    session["is_first_message"] = True
+    return chat_session, first_message_contents(task, message), True
+
+def finish_chat_turn(message, assistant_response, chat_session, task_key, is_new_chat):
+    """Registriere den Chat, zeige die Antwort an und speichere die Interaktion"""
+    if is_new_chat:
+        register_chat_session(task_key, chat_session)
+    
+    return add_chat_message("assistant", assistant_response)
+
+def busy_response(error):
+    """Antwort, wenn der Assistent ausgelastet ist (die Meldung wird nicht gespeichert)"""
+    busy_line = f"<span class='assistant'>Assistant: {error}</span>"
+    payload = console_payload(right=True)
+    if "lines_right" in payload:
+        payload["lines_right"] = payload["lines_right"] + [busy_line]
+    else:
+        payload["notice_right"] = busy_line
+    return jsonify({**payload, "error": "assistant busy"}), 503
+
+def sse_event(event, data):
+    """Formatiere ein Server-Sent Event"""
+    with metrics.stage("json_serialize"):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @app.route("/chat", methods=["POST"])
 def chat():
-    global current_chat_session
-    
     try:
-        if (session["phase"] != "questions" or 
-            session["phase"] == "waiting"):
-            cache = get_session_cache()
-            return jsonify({
-                "lines_right": cache.get("lines_right", []), 
-                "error": "Chat not available"
-            })
-        
-        message = request.json.get("message", "").strip()
-        if not message:
-            cache = get_session_cache()
-            return jsonify({"lines_right": cache.get("lines_right", []), "error": "Empty message"})
+        message, task_key, error_response = check_chat_request()
+        if error_response:
+            return error_response
         
-        user_message_formatted = f"<span class='user'>You: {message}</span>"
-        append_right(user_message_formatted)
+        chat_session, contents, is_new_chat = open_chat_turn(message, task_key)
+        with metrics.stage("llm_send"):
+            response_text = run_llm_call(chat_session.send, contents)
         
-        cache = get_session_cache()
-        task_key = cache.get("current_task_key")
-        if not task_key:
-            return jsonify({"error": "No active task", "lines_right": cache.get("lines_right", [])})
+        # Während der Antwort können andere Requests (ggf. auf anderen Workern) den Cache geändert haben
+        reload_session_cache()
+        assistant_message_formatted = finish_chat_turn(message, response_text, chat_session, task_key, is_new_chat)
         
-        is_first_message = not session.get("is_first_message", False)
+        return jsonify({
+            **console_payload(right=True),
+            "latest_response": assistant_message_formatted
+        })
+    except AssistantBusyError as e:
+        return busy_response(e)
+    except Exception as e:
+        print(f"Chat error: {e}")
+        return jsonify({"error": str(e)}), 500
 
-        response = None
-        
-        while not response:
-            if is_first_message or current_chat_session is None:
-                system_prompt = config.TREATMENT_GROUP_PROMPT if session["treatment_group"] else config.CONTROL_GROUP_PROMPT
-                current_chat_session = genai_client.chats.create(
-                    model=LLM_MODEL,
-                    config=types.GenerateContentConfig(
-                        system_instruction=system_prompt,
-                        temperature=0,
-                        response_modalities=["TEXT"],
-                        max_output_tokens=2000
-                    )
-                )
-                
-                contents = []
-                
-                task = get_current_task()
-                if task and task.get('image_path'):
-                    img_path = os.path.join("static", "img", task['image_path'] + ".jpg")
-                    uploaded_file = None
-
-                    if os.path.exists(img_path):
-                        try:
-                            uploaded_file = genai_client.files.upload(
-                                file=img_path,
-                                config=types.UploadFileConfig(
-                                    mime_type="image/jpeg",
-                                    display_name=img_path
-                                )
-                            )
-                            contents.append(uploaded_file)
-                        except Exception as e:
-                            print(f"Error uploading image {img_path}: {e}")
-                    else:
-                        print(f"Image file not found: {img_path}")
-                
-                contents.append(f"Current math question: {task['question']}")
-                contents.append(f"User message: {message}")
-                
-                response = current_chat_session.send_message(contents)
-                
-                session["is_first_message"] = True
-            else:
-                contents = []
-                contents.append(f"User message: {message}")
-                response = current_chat_session.send_message(contents)
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    """Wie /chat, aber die Antwort wird als Server-Sent Events Token für Token gesendet"""
+    try:
+        message, task_key, error_response = check_chat_request()
+        if error_response:
+            return error_response
         
-        assistant_response = response.text
-        assistant_message_formatted = f"<span class='assistant'>Assistant: {assistant_response}</span>"
-        append_right(assistant_message_formatted)
+        chat_session, contents, is_new_chat = open_chat_turn(message, task_key)
         
-        add_chat_interaction(message, assistant_response)
+        # Der Stream wird im LLM-Thread-Pool gelesen und über eine Queue weitergereicht
+        chunks = queue.Queue()
         
-        cache = get_session_cache()
+        def produce():
+            try:
+                with metrics.stage("llm_stream"):
+                    for text in chat_session.stream(contents):
+                        chunks.put(("token", text))
+                chunks.put(("done", None))
+            except Exception as e:
+                chunks.put(("error", e))
         
-        return jsonify({
-            "lines_right": cache.get("lines_right", []),
-            "latest_response": assistant_message_formatted
-        })
+        submit_llm_call(produce)
+    except AssistantBusyError as e:
+        return busy_response(e)
     except Exception as e:
         print(f"Chat error: {e}")
         return jsonify({"error": str(e)}), 500
+    
+    def generate():
+        yield sse_event("start", console_payload(right=True))
+        
+        try:
+            parts = []
+            while True:
+                try:
+                    kind, value = chunks.get(timeout=config.LLM_TIMEOUT_SECONDS)
+                except queue.Empty:
+                    raise AssistantBusyError(config.ASSISTANT_BUSY_MESSAGE)
+                if kind == "error":
+                    raise value
+                if kind == "done":
+                    break
+                parts.append(value)
+                yield sse_event("token", {"text": value})
+            
+            reload_session_cache()
+            assistant_message_formatted = finish_chat_turn(message, "".join(parts), chat_session, task_key, is_new_chat)
+            
+            save_session_cache()
+            yield sse_event("done", {
+                **console_payload(right=True),
+                "latest_response": assistant_message_formatted
+            })
+        except Exception as e:
+            print(f"Chat error: {e}")
+            yield sse_event("error", {"error": str(e), **console_payload(right=True)})
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 if __name__ == "__main__":
     app.run(debug=True, port=os.getenv("PORT", default=5000))
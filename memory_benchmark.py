@@ -0,0 +1,73 @@
+"""
+Memory benchmark: per-session footprint of the task records as plain dicts (the former
+representation) and as the slotted record classes from records.py, measured with
+tracemalloc for a heavy synthetic session.
+
+    python memory_benchmark.py --sessions 200 --tasks 4 --turns 30
+"""
+import argparse
+import time
+import tracemalloc
+
+from records import ChatTurn, TaskRecord, UserInput
+
+
+def dict_session(tasks, turns):
+    records = []
+    for t in range(tasks):
+        record = {
+            "task_index": t,
+            "question": f"Question {t}",
+            "options": ["a", "b", "c", "d"],
+            "solution": "a",
+            "user_inputs": [],
+            "time_spent": 0,
+            "final_answer": None,
+            "certainty": None,
+            "task_type": "main",
+            "chat_history": []
+        }
+        for i in range(turns):
+            record["chat_history"].append({"timestamp": time.time(), "role": "user" if i % 2 == 0 else "assistant", "message": f"m{i}"})
+            record["user_inputs"].append({"timestamp": time.time(), "input": "a", "type": "invalid_answer"})
+        records.append(record)
+    return records
+
+
+def record_session(tasks, turns):
+    records = []
+    for t in range(tasks):
+        record = TaskRecord(t, f"Question {t}", ["a", "b", "c", "d"], "a", "main")
+        for i in range(turns):
+            record.chat_history.append(ChatTurn(time.time(), "user" if i % 2 == 0 else "assistant", f"m{i}"))
+            record.user_inputs.append(UserInput(time.time(), "a", "invalid_answer"))
+        records.append(record)
+    return records
+
+
+def measure(build, sessions, tasks, turns):
+    """Allocated bytes per session"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [build(tasks, turns) for _ in range(sessions)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return (after - before) / sessions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the memory footprint of dict and slotted task records")
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--tasks", type=int, default=4, help="tasks per session")
+    parser.add_argument("--turns", type=int, default=30, help="chat turns and inputs per task")
+    args = parser.parse_args()
+
+    dict_bytes = measure(dict_session, args.sessions, args.tasks, args.turns)
+    record_bytes = measure(record_session, args.sessions, args.tasks, args.turns)
+
+    print(f"{args.sessions} sessions, {args.tasks} tasks, {args.turns} chat turns and inputs per task\n")
+    print(f"{'Representation':<20} {'bytes/session':>14}")
+    print(f"{'dicts':<20} {dict_bytes:>14.0f}")
+    print(f"{'slotted records':<20} {record_bytes:>14.0f}")
+    print(f"\nSaving: {1 - record_bytes / dict_bytes:.0%}")
@@ -0,0 +1,153 @@
+"""
+Opt-in timing instrumentation: durations of request stages (session loading, task
+loading, LLM calls, JSON serialization, uploads, ...) collected as histograms, rendered in
+the Prometheus text format for /metrics and optionally logged as one JSON line per request.
+
+    with metrics.stage("task_load"):
+        ...
+    with metrics.lock_wait(lock, "session_lock_wait"):
+        ...
+
+Disabled (the default), stage() returns a shared no-op context manager and lock_wait()
+returns the lock itself, so the instrumented code pays one function call.
+"""
+import contextlib
+import json
+import threading
+import time
+
+enabled = False
+log_requests = False
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_stages = {}    # stage -> [bucket counts..., count, sum]
+_requests = {}  # (endpoint, method, status) -> [bucket counts..., count, sum]
+_current = threading.local()  # Stage durations of the request handled by this thread
+_null = contextlib.nullcontext()
+
+
+def configure(enable, log=False):
+    global enabled, log_requests
+    enabled = enable
+    log_requests = enable and log
+
+
+def _observe(table, key, seconds):
+    with _lock:
+        entry = table.get(key)
+        if entry is None:
+            entry = table[key] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                entry[i] += 1
+                break
+        entry[-2] += 1
+        entry[-1] += seconds
+
+
+def observe(name, seconds):
+    """Record the duration of a stage (also in the log line of the current request)"""
+    _observe(_stages, name, seconds)
+    stages = getattr(_current, "stages", None)
+    if stages is not None:
+        stages[name] = stages.get(name, 0) + seconds
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def stage(name):
+    """Context manager timing a stage"""
+    return _Stage(name) if enabled else _null
+
+
+@contextlib.contextmanager
+def _timed_lock(lock, name):
+    start = time.perf_counter()
+    with lock:
+        observe(name, time.perf_counter() - start)
+        yield
+
+
+def lock_wait(lock, name):
+    """Acquire a lock (as context manager), recording the time spent waiting for it"""
+    return _timed_lock(lock, name) if enabled else lock
+
+
+def begin_request():
+    _current.stages = {}
+    _current.start = time.perf_counter()
+
+
+def end_request(endpoint, method, path, status):
+    """Record the duration of the current request and log it if request logging is on"""
+    stages = getattr(_current, "stages", None)
+    if stages is None:
+        return
+    duration = time.perf_counter() - _current.start
+    _current.stages = None
+    _observe(_requests, (endpoint or "", method, str(status)), duration)
+
+    if log_requests:
+        print(json.dumps({
+            "event": "request",
+            "time": round(time.time(), 3),
+            "method": method,
+            "path": path,
+            "endpoint": endpoint,
+            "status": status,
+            "duration_ms": round(duration * 1000, 3),
+            "stages_ms": {name: round(seconds * 1000, 3) for name, seconds in stages.items()}
+        }, separators=(",", ":")))
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _histogram(lines, metric, help_text, table, label_names):
+    lines.append(f"# HELP {metric} {help_text}")
+    lines.append(f"# TYPE {metric} histogram")
+    for key, entry in sorted(table.items()):
+        values = key if isinstance(key, tuple) else (key,)
+        labels = ",".join(f'{name}="{_label(value)}"' for name, value in zip(label_names, values))
+        cumulative = 0
+        for bound, count in zip(BUCKETS, entry):
+            cumulative += count
+            lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {entry[-2]}')
+        lines.append(f"{metric}_sum{{{labels}}} {entry[-1]:.6f}")
+        lines.append(f"{metric}_count{{{labels}}} {entry[-2]}")
+
+
+def render(gauges=None):
+    """All metrics in the Prometheus text format; gauges: {name: (help, {labels tuple or None: value})}"""
+    with _lock:
+        stages = {key: list(entry) for key, entry in _stages.items()}
+        requests = {key: list(entry) for key, entry in _requests.items()}
+
+    lines = []
+    _histogram(lines, "lcode_request_duration_seconds", "Duration of HTTP requests",
+               requests, ("endpoint", "method", "status"))
+    _histogram(lines, "lcode_stage_duration_seconds", "Duration of instrumented stages", stages, ("stage",))
+    for name, (help_text, samples) in (gauges or {}).items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in samples.items():
+            label_text = "{" + ",".join(f'{k}="{_label(v)}"' for k, v in labels) + "}" if labels else ""
+            lines.append(f"{name}{label_text} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,144 @@
+"""
+Compact record types for tasks, per-task records, chat turns and user inputs.
+
+The classes use __slots__ instead of a per-instance dict, which matters for sessions with
+many chat turns and inputs. to_json() builds the same dicts as the former ad-hoc records,
+so result files, the results journal and the event log keep their format.
+
+encode_record/decode_record are the json default/object_hook pair used to store records
+in the session store: a record is written as its to_json() dict plus a "__record__" tag.
+"""
+
+
+class Task:
+    __slots__ = ("id", "question", "options", "correct_solution", "image_path", "task_type", "image_file")
+
+    def __init__(self, question, options, correct_solution, image_path="", task_type="main", id=None):
+        self.id = id
+        self.question = question
+        self.options = options
+        self.correct_solution = correct_solution
+        self.image_path = image_path
+        self.task_type = task_type
+        self.image_file = None  # Path of the image if it exists, checked by the task bank at load time
+
+    def to_json(self):
+        return {
+            "id": self.id,
+            "question": self.question,
+            "options": self.options,
+            "correct_solution": self.correct_solution,
+            "image_path": self.image_path,
+            "task_type": self.task_type
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["question"], data["options"], data["correct_solution"],
+                   data.get("image_path", ""), data.get("task_type", "main"), data.get("id"))
+
+
+class ChatTurn:
+    __slots__ = ("timestamp", "role", "message")
+
+    def __init__(self, timestamp, role, message):
+        self.timestamp = timestamp
+        self.role = role
+        self.message = message
+
+    def to_json(self):
+        return {"timestamp": self.timestamp, "role": self.role, "message": self.message}
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["timestamp"], data["role"], data["message"])
+
+
+class UserInput:
+    __slots__ = ("timestamp", "input", "type")
+
+    def __init__(self, timestamp, input, type="answer"):
+        self.timestamp = timestamp
+        self.input = input
+        self.type = type
+
+    def to_json(self):
+        return {"timestamp": self.timestamp, "input": self.input, "type": self.type}
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["timestamp"], data["input"], data.get("type", "answer"))
+
+
+class TaskRecord:
+    """Everything recorded about one task of a participant"""
+    __slots__ = ("task_index", "question", "options", "solution", "user_inputs", "time_spent",
+                 "final_answer", "certainty", "task_type", "chat_history", "logged")
+
+    def __init__(self, task_index, question, options, solution, task_type,
+                 user_inputs=None, chat_history=None, time_spent=0, final_answer=None, certainty=None):
+        self.task_index = task_index
+        self.question = question
+        self.options = options
+        self.solution = solution
+        self.task_type = task_type
+        self.user_inputs = user_inputs if user_inputs is not None else []
+        self.chat_history = chat_history if chat_history is not None else []
+        self.time_spent = time_spent
+        self.final_answer = final_answer
+        self.certainty = certainty
+        self.logged = False  # All events of the task are in the event log
+
+    def to_json(self):
+        return {
+            "task_index": self.task_index,
+            "question": self.question,
+            "options": self.options,
+            "solution": self.solution,
+            "user_inputs": [user_input.to_json() for user_input in self.user_inputs],
+            "time_spent": self.time_spent,
+            "final_answer": self.final_answer,
+            "certainty": self.certainty,
+            "task_type": self.task_type,
+            "chat_history": [turn.to_json() for turn in self.chat_history]
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        record = cls(
+            data["task_index"], data["question"], data["options"], data["solution"], data["task_type"],
+            [UserInput.from_json(x) for x in data.get("user_inputs", [])],
+            [ChatTurn.from_json(x) for x in data.get("chat_history", [])],
+            data.get("time_spent", 0), data.get("final_answer"), data.get("certainty")
+        )
+        record.logged = data.get("logged", False)
+        return record
+
+    def compact(self):
+        """Copy without chat history and inputs (for finished tasks whose events are logged)"""
+        record = TaskRecord(self.task_index, self.question, self.options, self.solution, self.task_type,
+                            time_spent=self.time_spent, final_answer=self.final_answer, certainty=self.certainty)
+        record.logged = True
+        return record
+
+
+RECORD_TYPES = {cls.__name__: cls for cls in (Task, ChatTurn, UserInput, TaskRecord)}
+
+
+def encode_record(obj):
+    """json.dumps default= hook: records as tagged dicts"""
+    if type(obj).__name__ in RECORD_TYPES:
+        data = obj.to_json()
+        if isinstance(obj, TaskRecord):
+            data["logged"] = obj.logged
+        data["__record__"] = type(obj).__name__
+        return data
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def decode_record(data):
+    """json.loads object_hook= counterpart of encode_record"""
+    record_type = data.pop("__record__", None)
+    if record_type is None:
+        return data
+    return RECORD_TYPES[record_type].from_json(data)
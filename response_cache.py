@@ -0,0 +1,107 @@
+"""
+Persistent cache of benchmark answers (SQLite), so that re-running the benchmark only
+queries the (model, task) pairs that are new or changed.
+
+The key is a SHA-256 over the provider, the model, its request options and the exact
+message content: the prompt text and the content hash of each image. With the provider
+in the key, answers of an offline run (BENCHMARK_PROVIDER=fake) never count for a real one. Entries older than ttl seconds are
+ignored; errors are never cached.
+
+    python response_cache.py benchmark_cache.sqlite --purge
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from llm_backend import InlineImage, UploadedFile
+
+
+def request_key(provider, model, options, content):
+    """Cache key of one request (provider: provider name, e.g. "openai")"""
+    parts = []
+    for item in content:
+        if isinstance(item, UploadedFile):
+            item = item.native
+        if isinstance(item, InlineImage):
+            parts.append({"image": item.digest()})
+        else:
+            parts.append({"text": item})
+    payload = json.dumps({"provider": provider, "model": model, "options": options, "content": parts}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path, ttl=None):
+        self.path = path
+        self.ttl = ttl
+        self.local = threading.local()
+        self.counters = {"hits": 0, "misses": 0, "stored": 0}
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT NOT NULL, answer TEXT NOT NULL, "
+                "elapsed REAL NOT NULL, created REAL NOT NULL)"
+            )
+
+    def _connection(self):
+        """One connection per thread"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def _count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def get(self, key):
+        """(answer, seconds the original request took) or None if missing or expired"""
+        row = self._connection().execute("SELECT answer, elapsed, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None or (self.ttl and time.time() - row[2] > self.ttl):
+            self._count("misses")
+            return None
+        self._count("hits")
+        return row[0], row[1]
+
+    def put(self, key, model, answer, elapsed):
+        self._connection().execute(
+            "INSERT INTO responses (key, model, answer, elapsed, created) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET answer = excluded.answer, elapsed = excluded.elapsed, created = excluded.created",
+            (key, model, answer, elapsed, time.time())
+        )
+        self._count("stored")
+
+    def purge(self):
+        """Delete expired entries; returns their number"""
+        if not self.ttl:
+            return 0
+        cursor = self._connection().execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+        return cursor.rowcount
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or purge the benchmark response cache")
+    parser.add_argument("path", help="cache database, e.g. benchmark_cache.sqlite")
+    parser.add_argument("--ttl", type=float, default=30 * 24 * 60 * 60, help="seconds an answer stays valid")
+    parser.add_argument("--purge", action="store_true", help="delete expired answers")
+    args = parser.parse_args()
+
+    cache = ResponseCache(args.path, args.ttl)
+    if args.purge:
+        print(f"Deleted {cache.purge()} expired answers")
+    for model, count in cache._connection().execute("SELECT model, COUNT(*) FROM responses GROUP BY model ORDER BY model"):
+        print(f"{model:<20} {count:>6}")
@@ -0,0 +1,219 @@
+"""
+Durable upload queue for result files.
+
+Results are written atomically into a spool directory (<spool>/pending) and background
+threads (one by default) upload them. A file is claimed by renaming it into
+<spool>/uploading, so several worker processes can share one spool directory without
+uploading a file twice. Failed uploads go back to pending and are retried with
+exponential backoff; files left in uploading by a crashed process are returned to
+pending, and everything still pending is drained when the process starts again.
+Errors a retry cannot fix (HTTP 4xx other than 408 and 429, invalid URLs) move the
+files to <spool>/failed instead, where they wait for manual attention.
+
+With batch_size > 1, up to batch_size pending results are uploaded together as one
+file containing a JSON list.
+"""
+import json
+import os
+import random
+import threading
+import time
+
+
+def is_permanent(error):
+    """Whether a failed upload would fail again: HTTP 4xx except 408 Request Timeout and 429 Too Many
+    Requests (errors with a status_code), or an invalid URL (requests raises those as ValueError)"""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return 400 <= status < 500 and status not in (408, 429)
+    return isinstance(error, ValueError)
+
+
+class UploadQueue:
+    def __init__(self, spool_dir, upload, batch_size=1, workers=1, retry_base=2, retry_max=300,
+                 scan_interval=30, claim_timeout=600):
+        """upload(remote_name, local_path) uploads one file and raises on failure"""
+        self.pending_dir = os.path.join(spool_dir, "pending")
+        self.uploading_dir = os.path.join(spool_dir, "uploading")
+        self.failed_dir = os.path.join(spool_dir, "failed")
+        self.upload = upload
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.scan_interval = scan_interval
+        self.claim_timeout = claim_timeout
+        self.condition = threading.Condition()
+        self.threads = []
+        self.stopped = False
+        os.makedirs(self.pending_dir, exist_ok=True)
+        os.makedirs(self.uploading_dir, exist_ok=True)
+        os.makedirs(self.failed_dir, exist_ok=True)
+
+    def start(self):
+        """Re-queue unfinished uploads of earlier processes and start the upload threads (once)"""
+        with self.condition:
+            if self.threads:
+                return
+            # Claims with our own PID are from an earlier process that had the same PID
+            # (e.g. after a container restart); later recoveries must skip them
+            self.recover(include_own=True)
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"result-uploader-{i}", daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def stop(self, timeout=None):
+        """Stop the upload threads after their current upload"""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def enqueue(self, filename, data):
+        """Write data as JSON to the spool and wake the upload thread; returns the spool path"""
+        path = os.path.join(self.pending_dir, filename)
+        tmp_path = os.path.join(self.pending_dir, f".{filename}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+        with self.condition:
+            self.condition.notify()
+        return path
+
+    def pending(self):
+        """Names of the files waiting for upload, oldest first"""
+        entries = []
+        for name in os.listdir(self.pending_dir):
+            if name.startswith("."):
+                continue
+            try:
+                entries.append((os.path.getmtime(os.path.join(self.pending_dir, name)), name))
+            except OSError:
+                continue
+        return [name for _, name in sorted(entries)]
+
+    def _claim(self, names):
+        """Move files from pending to uploading; returns [(name, claimed_path)] of the files this process got"""
+        claimed = []
+        for name in names:
+            claimed_path = os.path.join(self.uploading_dir, f"{name}@{os.getpid()}")
+            try:
+                os.rename(os.path.join(self.pending_dir, name), claimed_path)
+            except FileNotFoundError:
+                continue  # Claimed by another process
+            os.utime(claimed_path)
+            claimed.append((name, claimed_path))
+        return claimed
+
+    def _release(self, claimed):
+        """Return claimed files to pending (unless a newer version was spooled meanwhile)"""
+        for name, claimed_path in claimed:
+            target = os.path.join(self.pending_dir, name)
+            if os.path.exists(target):
+                os.remove(claimed_path)
+            else:
+                os.rename(claimed_path, target)
+
+    def _fail(self, claimed, error):
+        """Move claimed files to failed; they are not retried"""
+        for name, claimed_path in claimed:
+            os.replace(claimed_path, os.path.join(self.failed_dir, name))
+            print(f"Upload of {name} failed permanently ({error}); moved to {self.failed_dir}")
+
+    def recover(self, include_own=False):
+        """Return files left in uploading by dead or stuck processes to pending"""
+        now = time.time()
+        for entry in os.listdir(self.uploading_dir):
+            name, _, pid = entry.rpartition("@")
+            if not name or not pid.isdigit():
+                continue
+            path = os.path.join(self.uploading_dir, entry)
+            try:
+                if int(pid) == os.getpid():
+                    stale = include_own
+                else:
+                    stale = not pid_alive(int(pid)) or now - os.path.getmtime(path) > self.claim_timeout
+                if stale:
+                    self._release([(name, path)])
+                    print(f"Re-queued unfinished upload {name}")
+            except OSError:
+                continue
+
+    def _upload(self, claimed):
+        if len(claimed) == 1:
+            name, path = claimed[0]
+            self.upload(name, path)
+            return
+
+        # Several results in one file, i.e. one upload request
+        batch = []
+        for _, path in claimed:
+            with open(path, "r", encoding="utf-8") as f:
+                batch.append(json.load(f))
+        batch_name = f"results_batch_{int(time.time() * 1000)}_{os.getpid()}_{threading.get_ident()}.json"
+        batch_path = os.path.join(self.uploading_dir, f".{batch_name}")
+        try:
+            with open(batch_path, "w", encoding="utf-8") as f:
+                json.dump(batch, f, ensure_ascii=False, indent=2)
+            self.upload(batch_name, batch_path)
+        finally:
+            if os.path.exists(batch_path):
+                os.remove(batch_path)
+
+    def _run(self):
+        last_recover = time.time()
+        failures = 0
+
+        while not self.stopped:
+            with self.condition:
+                names = self.pending()
+                if not names:
+                    self.condition.wait(timeout=self.scan_interval)
+            if not names:
+                if time.time() - last_recover >= self.scan_interval:
+                    self.recover()
+                    last_recover = time.time()
+                continue
+
+            if self.stopped:
+                break
+            claimed = self._claim(names[:self.batch_size])
+            if not claimed:
+                continue
+
+            try:
+                self._upload(claimed)
+            except Exception as e:
+                if is_permanent(e):
+                    self._fail(claimed, e)
+                    continue
+                self._release(claimed)
+                failures += 1
+                delay = min(self.retry_max, self.retry_base * 2 ** (failures - 1))
+                delay *= random.uniform(0.8, 1.2)
+                print(f"Upload of {', '.join(name for name, _ in claimed)} failed ({e}); retrying in {delay:.0f}s")
+                # Wait on the condition so that stop() ends the backoff at once
+                with self.condition:
+                    self.condition.wait_for(lambda: self.stopped, timeout=delay)
+                continue
+
+            failures = 0
+            for name, path in claimed:
+                os.remove(path)
+                print(f"Successfully uploaded {name}")
+
+
+def pid_alive(pid):
+    """Whether a process with this PID exists"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,73 @@
+"""
+Route microbenchmark: measures the server-side time per request of the cheap routes
+(static files, /status polls, empty console commands) with Flask's test client, i.e. the
+per-request overhead of the session handling without network or browser.
+
+Run it on two versions of main.py to compare them:
+    python route_benchmark.py --requests 2000
+"""
+import argparse
+import os
+import statistics
+import time
+
+# The measured routes make no LLM or WebDAV calls; the fake provider and a dummy URL let main.py start offline
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("SCIEBO_URL", "http://127.0.0.1:9")
+
+import main
+
+
+def start_session(client):
+    """New participant who has entered a Prolific ID and is at the first question"""
+    client.get("/")
+    client.post("/command", json={"input": "BENCHMARK01"})
+    client.post("/command", json={"input": ""})
+
+
+def measure(client, method, url, count, **kwargs):
+    """Duration of count requests in milliseconds"""
+    durations = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = client.open(url, method=method, **kwargs)
+        response.get_data()
+        response.close()
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def run_benchmark(count):
+    client = main.app.test_client()
+    start_session(client)
+    right_seq = client.get("/status?right_seq=0").get_json()["right"]["seq"]
+
+    routes = [
+        ("GET", "/static/css/style.css", {}),
+        ("GET", "/status", {}),
+        ("GET", f"/status?right_seq={right_seq}", {}),
+        ("POST", "/command", {"json": {"input": ""}}),
+    ]
+
+    results = []
+    for method, url, kwargs in routes:
+        measure(client, method, url, min(count, 50), **kwargs)  # Warm-up
+        durations = sorted(measure(client, method, url, count, **kwargs))
+        results.append({
+            "route": f"{method} {url}",
+            "mean": statistics.mean(durations),
+            "p50": durations[len(durations) // 2],
+            "p95": durations[int(len(durations) * 0.95) - 1],
+        })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the per-request overhead of the Flask routes")
+    parser.add_argument("--requests", type=int, default=1000, help="requests per route")
+    args = parser.parse_args()
+
+    print(f"Session store: {type(main.session_store).__name__}, {args.requests} requests per route\n")
+    print(f"{'Route':<40} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for result in run_benchmark(args.requests):
+        print(f"{result['route']:<40} {result['mean']:>9.3f} {result['p50']:>9.3f} {result['p95']:>9.3f}")
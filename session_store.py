@@ -0,0 +1,412 @@
+"""
+Session stores for the per-participant data that does not fit into the Flask cookie
+(console lines, results, record data).
+
+MemorySessionStore keeps everything in a dict of the current process. It tracks the
+approximate size of every session (estimated bytes per key, counted incrementally for
+lists that only grew) and, with a byte budget, evicts the least recently used sessions
+that the application marks as evictable.
+SQLiteSessionStore keeps the data in a SQLite database in WAL mode so that several
+gunicorn workers on the same machine can share it.
+
+Every save increases the version of the session. wait_changed() blocks until the version
+of one session differs from a known one, so a push stream only wakes up for changes of
+its own session (saves by other processes are noticed by polling the SQLite store).
+"""
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+from records import encode_record, decode_record
+
+
+class SessionStore:
+    """Interface of a session store"""
+
+    def load(self, session_id, keys=None):
+        """Return the data of a session (only the given keys if keys is not None) or None if it does not exist"""
+        raise NotImplementedError
+
+    def save(self, session_id, data, keys=None):
+        """Persist the data of a session (only the given keys if keys is not None)"""
+        raise NotImplementedError
+
+    def touch(self, session_id, timestamp):
+        """Set the last access time of a session"""
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        """Remove a session"""
+        raise NotImplementedError
+
+    def expire(self, cutoff_time):
+        """Remove all sessions last accessed before cutoff_time and return their IDs"""
+        raise NotImplementedError
+
+    def version(self, session_id):
+        """Change counter of a session (increased by every save) or None if it does not exist"""
+        raise NotImplementedError
+
+    def wait_changed(self, session_id, version, timeout):
+        """Wait at most timeout seconds until the version of a session differs from version;
+        returns the current version (None if the session was removed)"""
+        raise NotImplementedError
+
+    def stats(self):
+        """Counters of the store (hits, misses, evictions, ...)"""
+        return {}
+
+
+class SessionWatch:
+    """Threads waiting for changes of one session"""
+    __slots__ = ("condition", "waiting", "notifications")
+
+    def __init__(self, lock):
+        self.condition = threading.Condition(lock)
+        self.waiting = 0
+        self.notifications = 0
+
+    def wait(self, predicate, timeout):
+        """Wait until predicate() is true (checked after every notification) or timeout seconds have passed"""
+        with self.condition:
+            return self.condition.wait_for(predicate, timeout)
+
+
+class SessionWaiters:
+    """Waiting threads per session; notify() wakes only the waiters of that session"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.watches = {}  # session_id -> SessionWatch
+
+    def notify(self, session_id):
+        with self.lock:
+            watch = self.watches.get(session_id)
+            if watch is not None:
+                watch.notifications += 1
+                watch.condition.notify_all()
+
+    @contextlib.contextmanager
+    def watch(self, session_id):
+        """Register as waiter of a session while the block runs; yields its SessionWatch"""
+        with self.lock:
+            watch = self.watches.get(session_id)
+            if watch is None:
+                watch = self.watches[session_id] = SessionWatch(self.lock)
+            watch.waiting += 1
+        try:
+            yield watch
+        finally:
+            with self.lock:
+                watch.waiting -= 1
+                if not watch.waiting:
+                    del self.watches[session_id]
+
+
+def approx_size(value, known=None, measured=None):
+    """Approximate memory footprint of a value: about the length of its JSON encoding, estimated
+    by walking the value (strings, containers and slotted records) instead of encoding it.
+
+    measured collects {id(list): (list, length, size)} of the lists walked; passed as known to a
+    later call, a list that is still the same object and only grew is measured by its new items."""
+    if isinstance(value, str):
+        return len(value) + 2
+    if isinstance(value, list):
+        length = len(value)
+        entry = known.get(id(value)) if known else None
+        if entry is not None and entry[0] is value and entry[1] <= length:
+            size = entry[2] + sum(approx_size(item, known, measured) + 1 for item in value[entry[1]:length])
+        else:
+            size = 2 + sum(approx_size(item, known, measured) + 1 for item in value[:length])
+        if measured is not None:
+            measured[id(value)] = (value, length, size)
+        return size
+    if isinstance(value, dict):
+        return 2 + sum(len(str(key)) + 3 + approx_size(item, known, measured) for key, item in list(value.items()))
+    if isinstance(value, tuple):
+        return 2 + sum(approx_size(item, known, measured) + 1 for item in value)
+    slots = getattr(type(value), "__slots__", None)
+    if slots:
+        return 2 + sum(len(name) + 3 + approx_size(getattr(value, name, None), known, measured) for name in slots)
+    return 8
+
+
+class MemorySessionStore(SessionStore):
+    """In-process store; load returns the live dict, so in-place changes need no save
+    (but only saved keys are counted in the byte accounting)"""
+
+    def __init__(self, max_bytes=None, evictable=None, on_evict=None):
+        """max_bytes: byte budget of all sessions; evictable(session_id, data) decides whether a
+        session may be evicted to meet it; on_evict(session_id, data) is called after eviction"""
+        self.sessions = OrderedDict()  # Least recently used first
+        self.sizes = {}                # session_id -> {key: (bytes, lists measured, see approx_size)}
+        self.total_bytes = 0
+        self.max_bytes = max_bytes
+        self.evictable = evictable
+        self.on_evict = on_evict
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+        self.versions = {}             # session_id -> version
+        self.waiters = SessionWaiters()
+        self.lock = threading.RLock()
+
+    def _measure(self, session_id, data, keys):
+        """Sizes of the saved keys, measured before taking the lock; lists that only grew since the
+        last save (console lines, records, chat turns and inputs are appended) count only their new items"""
+        known = self.sizes.get(session_id) or {}
+        sizes = {}
+        for key in (list(data) if keys is None else keys):
+            if key not in data:
+                sizes[key] = (0, None)
+                continue
+            previous = known.get(key)
+            measured = {}
+            sizes[key] = (approx_size(data[key], previous[1] if previous else None, measured), measured)
+        return sizes
+
+    def _account(self, session_id, sizes):
+        known = self.sizes.setdefault(session_id, {})
+        for key, entry in sizes.items():
+            previous = known.get(key)
+            self.total_bytes += entry[0] - (previous[0] if previous else 0)
+            known[key] = entry
+
+    def _forget(self, session_id):
+        self.sessions.pop(session_id, None)
+        self.total_bytes -= sum(entry[0] for entry in self.sizes.pop(session_id, {}).values())
+        self.versions.pop(session_id, None)
+        self.waiters.notify(session_id)
+
+    def load(self, session_id, keys=None):
+        with metrics.lock_wait(self.lock, "session_lock_wait"):
+            data = self.sessions.get(session_id)
+            if data is None:
+                self.counters["misses"] += 1
+            else:
+                self.counters["hits"] += 1
+                self.sessions.move_to_end(session_id)
+            return data
+
+    def save(self, session_id, data, keys=None):
+        # A new session is counted with all its keys
+        sizes = self._measure(session_id, data, keys if session_id in self.sessions else None)
+        with metrics.lock_wait(self.lock, "session_lock_wait"):
+            current = self.sessions.get(session_id)
+            if current is None:
+                self.sessions[session_id] = data
+            else:
+                if current is not data:
+                    current.update(data if keys is None else {k: data[k] for k in keys if k in data})
+                self.sessions.move_to_end(session_id)
+            self._account(session_id, sizes)
+            self.versions[session_id] = self.versions.get(session_id, 0) + 1
+        self.waiters.notify(session_id)
+        self.enforce_budget()
+
+    def touch(self, session_id, timestamp):
+        with self.lock:
+            data = self.sessions.get(session_id)
+            if data is not None:
+                data['last_access'] = timestamp
+                self.sessions.move_to_end(session_id)
+
+    def delete(self, session_id):
+        with self.lock:
+            self._forget(session_id)
+
+    def expire(self, cutoff_time):
+        with self.lock:
+            expired_sessions = [
+                sid for sid, data in self.sessions.items()
+                if data.get('last_access', 0) < cutoff_time
+            ]
+
+            for sid in expired_sessions:
+                self._forget(sid)
+
+        return expired_sessions
+
+    def version(self, session_id):
+        with self.lock:
+            return self.versions.get(session_id)
+
+    def wait_changed(self, session_id, version, timeout):
+        with self.waiters.watch(session_id) as watch:
+            watch.wait(lambda: self.versions.get(session_id) != version, timeout)
+        return self.version(session_id)
+
+    def enforce_budget(self):
+        """Evict least recently used evictable sessions until the byte budget is met"""
+        if not self.max_bytes or self.total_bytes <= self.max_bytes:
+            return
+
+        evicted = []
+        with self.lock:
+            for sid, data in list(self.sessions.items()):
+                if self.total_bytes <= self.max_bytes:
+                    break
+                if self.evictable and not self.evictable(sid, data):
+                    continue
+                self._forget(sid)
+                evicted.append((sid, data))
+            self.counters["evictions"] += len(evicted)
+            if evicted:
+                print(f"Evicted {len(evicted)} session(s) to meet the memory budget "
+                      f"({self.total_bytes} of {self.max_bytes} bytes in use)")
+
+        for sid, data in evicted:
+            if self.on_evict:
+                try:
+                    self.on_evict(sid, data)
+                except Exception as e:
+                    print(f"Error after evicting session {sid}: {e}")
+
+    def stats(self):
+        with self.lock:
+            return {
+                **self.counters,
+                "sessions": len(self.sessions),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes
+            }
+
+
+class SQLiteSessionStore(SessionStore):
+    """Store shared by all processes on one machine (SQLite in WAL mode, one row per key); waiting
+    threads are woken by saves of this process and check for saves of others every poll_interval seconds"""
+
+    def __init__(self, path, poll_interval=2.0):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.local = threading.local()
+        self.counters = {"hits": 0, "misses": 0}
+        self.waiters = SessionWaiters()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._connection()
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, last_access REAL NOT NULL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS session_data ("
+                "session_id TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "PRIMARY KEY (session_id, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access)")
+            # Stores created before the version column existed
+            if "version" not in [row[1] for row in conn.execute("PRAGMA table_info(sessions)")]:
+                conn.execute("ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+    def _connection(self):
+        """One connection per thread"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def load(self, session_id, keys=None):
+        conn = self._connection()
+        row = conn.execute("SELECT last_access FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            self.counters["misses"] += 1
+            return None
+        self.counters["hits"] += 1
+
+        if keys is None:
+            rows = conn.execute("SELECT key, value FROM session_data WHERE session_id = ?", (session_id,))
+        else:
+            keys = list(keys)
+            rows = conn.execute(
+                f"SELECT key, value FROM session_data WHERE session_id = ? AND key IN ({', '.join('?' * len(keys))})",
+                (session_id, *keys)
+            )
+        data = {key: json.loads(value, object_hook=decode_record) for key, value in rows}
+        data['last_access'] = row[0]
+        return data
+
+    def save(self, session_id, data, keys=None):
+        keys = [k for k in (data.keys() if keys is None else keys) if k in data and k != 'last_access']
+        rows = [(session_id, k, json.dumps(data[k], ensure_ascii=False, default=encode_record)) for k in keys]
+
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO sessions (session_id, last_access, version) VALUES (?, ?, 1) "
+                "ON CONFLICT(session_id) DO UPDATE SET last_access = excluded.last_access, version = version + 1",
+                (session_id, data.get('last_access', time.time()))
+            )
+            conn.executemany(
+                "INSERT INTO session_data (session_id, key, value) VALUES (?, ?, ?) "
+                "ON CONFLICT(session_id, key) DO UPDATE SET value = excluded.value",
+                rows
+            )
+        self.waiters.notify(session_id)
+
+    def touch(self, session_id, timestamp):
+        conn = self._connection()
+        conn.execute("UPDATE sessions SET last_access = ? WHERE session_id = ?", (timestamp, session_id))
+
+    def delete(self, session_id):
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM session_data WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        self.waiters.notify(session_id)
+
+    def expire(self, cutoff_time):
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            expired_sessions = [row[0] for row in conn.execute(
+                "SELECT session_id FROM sessions WHERE last_access < ?", (cutoff_time,)
+            )]
+            conn.executemany("DELETE FROM session_data WHERE session_id = ?", [(sid,) for sid in expired_sessions])
+            conn.executemany("DELETE FROM sessions WHERE session_id = ?", [(sid,) for sid in expired_sessions])
+
+        for sid in expired_sessions:
+            self.waiters.notify(sid)
+        return expired_sessions
+
+    def version(self, session_id):
+        row = self._connection().execute("SELECT version FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else None
+
+    def wait_changed(self, session_id, version, timeout):
+        deadline = time.monotonic() + timeout
+        with self.waiters.watch(session_id) as watch:
+            while True:
+                # Notifications are counted before reading the version, so a save in between is not missed
+                seen = watch.notifications
+                current = self.version(session_id)
+                remaining = deadline - time.monotonic()
+                if current != version or remaining <= 0:
+                    return current
+                watch.wait(lambda: watch.notifications != seen, min(remaining, self.poll_interval))
+
+    def stats(self):
+        conn = self._connection()
+        return {
+            **self.counters,
+            "sessions": conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        }
+
+
+def create_session_store(backend="memory", path=None, max_bytes=None, evictable=None, on_evict=None, poll_interval=2.0):
+    """Create the session store for the configured backend ('memory' or 'sqlite'); the byte
+    budget and eviction callbacks only apply to the memory backend, poll_interval only to sqlite"""
+    if backend == "memory":
+        return MemorySessionStore(max_bytes, evictable, on_evict)
+    if backend == "sqlite":
+        return SQLiteSessionStore(path or os.path.join("data", "sessions.db"), poll_interval)
+    raise ValueError(f"Unknown session store backend: {backend}")
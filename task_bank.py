@@ -0,0 +1,146 @@
+"""
+Task bank: parses data/tasks.csv once into an index by task ID and task type and draws
+a seeded sample of tasks per participant session. The file is re-read in a background
+thread when its modification time changes; requests keep using the previous index
+until the new one is ready.
+
+Everything about a task that is the same for every participant is prepared at load time:
+the image file is checked once (Task.image_file) and the optional render callback builds
+the fixed part of the question panel, kept per task ID in a render cache.
+"""
+import csv
+import os
+import random
+import threading
+import time
+
+from records import Task
+
+
+class TaskBank:
+    def __init__(self, csv_file, reload_interval=5, image_dir=None, render=None):
+        self.csv_file = csv_file
+        self.reload_interval = reload_interval
+        self.image_dir = image_dir
+        self.render = render
+        self.by_id = {}
+        self.by_type = {}
+        self.rendered = {}  # Task ID -> precompiled lines of render(task)
+        self.retired = {}  # Tasks removed by a reload; sessions that drew them can still resolve them
+        self.mtime = None
+        self.last_check = 0
+        self.reloading = False
+        self.lock = threading.Lock()
+        self.reload()
+
+    def parse(self):
+        """Read and validate the CSV file; return (by_id, by_type, rendered)"""
+        by_id = {}
+        by_type = {}
+
+        with open(self.csv_file, "r", encoding="utf-8") as f:
+            reader = csv.DictReader(f, delimiter=";")
+            for line_no, row in enumerate(reader, start=2):
+                task = Task(
+                    question=(row.get("question") or "").strip(),
+                    options=[x.strip() for x in (row.get("options") or "").split(";") if x.strip()],
+                    correct_solution=(row.get("correct_solution") or "").strip(),
+                    image_path=(row.get("image_path") or "").strip(),
+                    task_type=(row.get("task_type") or "main").strip()
+                )
+                if not task.question or not task.correct_solution:
+                    print(f"Skipping invalid task in {self.csv_file} line {line_no}: question and correct_solution are required")
+                    continue
+                if task.task_type not in ("test", "main"):
+                    print(f"Unknown task_type '{task.task_type}' in {self.csv_file} line {line_no}, using 'main'")
+                    task.task_type = "main"
+                if task.correct_solution not in task.options:
+                    task.options.append(task.correct_solution)
+
+                # The image ID identifies a task; rows without image get their line number
+                task_id = task.image_path or f"line{line_no}"
+                if task_id in by_id:
+                    task_id = f"{task_id}-{line_no}"
+                task.id = task_id
+
+                if task.image_path and self.image_dir:
+                    image_file = os.path.join(self.image_dir, task.image_path + ".jpg")
+                    if os.path.exists(image_file):
+                        task.image_file = image_file
+                    else:
+                        print(f"Image file not found for task {task_id}: {image_file}")
+
+                by_id[task_id] = task
+                by_type.setdefault(task.task_type, []).append(task_id)
+
+        rendered = {task_id: tuple(self.render(task)) for task_id, task in by_id.items()} if self.render else {}
+        return by_id, by_type, rendered
+
+    def reload(self):
+        """Re-read the CSV file and swap in the new index"""
+        try:
+            mtime = os.path.getmtime(self.csv_file)
+            by_id, by_type, rendered = self.parse()
+        except Exception as e:
+            print(f"Error loading tasks: {e}")
+            return False
+
+        with self.lock:
+            for task_id, task in self.by_id.items():
+                if task_id not in by_id:
+                    self.retired[task_id] = task
+            self.by_id = by_id
+            self.by_type = by_type
+            self.rendered = rendered
+            self.mtime = mtime
+        return True
+
+    def maybe_reload(self):
+        """Start a background reload if the file changed (checked at most every reload_interval seconds)"""
+        now = time.time()
+        if now - self.last_check < self.reload_interval:
+            return
+        self.last_check = now
+
+        try:
+            mtime = os.path.getmtime(self.csv_file)
+        except OSError:
+            return
+
+        with self.lock:
+            if mtime == self.mtime or self.reloading:
+                return
+            self.reloading = True
+
+        def worker():
+            try:
+                if self.reload():
+                    print(f"Reloaded tasks from {self.csv_file}")
+            finally:
+                self.reloading = False
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def get(self, task_id):
+        """Task by ID (also tasks removed by a reload) or None"""
+        return self.by_id.get(task_id) or self.retired.get(task_id)
+
+    def fragments(self, task):
+        """Precompiled render(task) lines of a task (rendered on demand for retired tasks)"""
+        lines = self.rendered.get(task.id)
+        if lines is None:
+            lines = tuple(self.render(task)) if self.render else ()
+        return lines
+
+    def ids(self, task_type):
+        """IDs of all tasks of a type"""
+        return self.by_type.get(task_type, [])
+
+    def sample(self, seed, counts):
+        """Seeded sample of task IDs per type, e.g. counts={"test": 1, "main": 3}"""
+        rng = random.Random(seed)
+        sample = {}
+        for task_type, count in counts.items():
+            ids = self.ids(task_type)
+            sample[task_type] = rng.sample(ids, min(count, len(ids)))
+        return sample
@@ -0,0 +1,22 @@
+import os
+import tempfile
+import unittest
+
+from response_cache import ResponseCache, request_key
+
+
+class RequestKeyTest(unittest.TestCase):
+    def test_fake_answer_is_no_hit_for_real_provider(self):
+        content = ["Which option is correct?"]
+        options = {"max_output_tokens": 50, "temperature": 0}
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResponseCache(os.path.join(directory, "cache.sqlite"))
+            cache.put(request_key("fake", "gpt-4o", options, content), "gpt-4o", "42", 0.1)
+
+            self.assertIsNone(cache.get(request_key("openai", "gpt-4o", options, content)))
+            self.assertEqual(cache.get(request_key("fake", "gpt-4o", options, content)), ("42", 0.1))
+            cache._connection().close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+"""
+Deadline scheduler for server-side timers.
+
+One background thread services a heap of (deadline, session_id, kind) entries. Each
+(session_id, kind) has at most one active deadline; rescheduling or cancelling leaves
+the old heap entry in place and it is skipped when it reaches the top (lazy deletion),
+so schedule and cancel are O(log n) and O(1).
+"""
+import heapq
+import itertools
+import threading
+import time
+
+
+class DeadlineScheduler:
+    """Calls handler(session_id, kind, deadline) once the deadline of a (session_id, kind) has passed"""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.heap = []
+        self.current = {}  # (session_id, kind) -> active deadline
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def start(self):
+        """Start the background thread (once)"""
+        with self.condition:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="deadline-scheduler", daemon=True)
+                self.thread.start()
+
+    def schedule(self, session_id, kind, deadline):
+        """Set (or replace) the deadline of a (session_id, kind)"""
+        with self.condition:
+            self.current[(session_id, kind)] = deadline
+            heapq.heappush(self.heap, (deadline, next(self.counter), session_id, kind))
+            if self.heap[0][0] == deadline:
+                self.condition.notify()
+
+    def cancel(self, session_id, kind):
+        """Remove the deadline of a (session_id, kind)"""
+        with self.condition:
+            self.current.pop((session_id, kind), None)
+
+    def deadline(self, session_id, kind):
+        """Active deadline of a (session_id, kind) or None"""
+        with self.condition:
+            return self.current.get((session_id, kind))
+
+    def __len__(self):
+        with self.condition:
+            return len(self.current)
+
+    def _next_due(self):
+        """Wait for the next due entry and remove it from the active deadlines"""
+        with self.condition:
+            while True:
+                # Skip entries that were rescheduled or cancelled
+                while self.heap:
+                    deadline, _, session_id, kind = self.heap[0]
+                    if self.current.get((session_id, kind)) == deadline:
+                        break
+                    heapq.heappop(self.heap)
+
+                now = time.time()
+                if self.heap and self.heap[0][0] <= now:
+                    deadline, _, session_id, kind = heapq.heappop(self.heap)
+                    del self.current[(session_id, kind)]
+                    return session_id, kind, deadline
+
+                self.condition.wait(timeout=self.heap[0][0] - now if self.heap else None)
+
+    def _run(self):
+        while True:
+            session_id, kind, deadline = self._next_due()
+            try:
+                self.handler(session_id, kind, deadline)
+            except Exception as e:
+                print(f"Error in deadline handler ({kind}, {session_id}): {e}")
@@ -0,0 +1,99 @@
+"""
+Upload benchmark: drains a spool of synthetic result files through the upload queue into
+the local WebDAV stand-in (webdav_standin.py) and reports throughput, HTTP requests and
+TCP connections. The baseline opens a new connection per upload and checks the parent
+collection first, as the previous webdav3 client did.
+
+    python upload_benchmark.py --files 200 --latency 0.02 --fail-rate 0.1
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+
+import requests
+
+from result_uploader import UploadQueue
+from webdav_standin import start_standin
+from webdav_uploader import WebDAVUploader
+
+REMOTE_DIRECTORY = "results"
+
+
+def make_result(i):
+    """Synthetic result of about the size of a real participant file"""
+    return {
+        "prolific_id": f"BENCH{i:05d}",
+        "session_id": f"{i:032x}",
+        "group": "treatment",
+        "statistics": {"total_tasks": 3, "correct_answers": 2, "accuracy": 2 / 3},
+        "main_tasks": [{"task_id": str(t), "chat_interactions": [{"user_message": "x" * 200}] * 5} for t in range(3)],
+    }
+
+
+def baseline_upload(server_url):
+    """New connection per upload: PROPFIND on the parent collection, then PUT"""
+    def upload(filename, filepath):
+        with requests.Session() as session:
+            session.request("PROPFIND", f"{server_url}/{REMOTE_DIRECTORY}/", headers={"Depth": "0"}, timeout=30).raise_for_status()
+            with open(filepath, "rb") as f:
+                session.put(f"{server_url}/{REMOTE_DIRECTORY}/{filename}", data=f, timeout=30).raise_for_status()
+    return upload
+
+
+def pooled_upload(server_url, max_parallel):
+    uploader = WebDAVUploader(server_url, max_parallel=max_parallel)
+
+    def upload(filename, filepath):
+        uploader.upload_file(f"{REMOTE_DIRECTORY}/{filename}", filepath)
+    return upload
+
+
+def run_case(name, files, latency, fail_rate, make_upload, workers=1, batch_size=1):
+    server = start_standin(latency=latency, fail_rate=fail_rate)
+    server.dirs.add(REMOTE_DIRECTORY)
+    spool_dir = tempfile.mkdtemp(prefix="upload-bench-")
+    try:
+        queue = UploadQueue(spool_dir, make_upload(server.url), batch_size=batch_size, workers=workers,
+                            retry_base=0.05, retry_max=1, scan_interval=0.5)
+        for i in range(files):
+            queue.enqueue(f"results_BENCH{i:05d}.json", make_result(i))
+
+        # The queue logs every upload; keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            queue.start()
+            while queue.pending() or os.listdir(queue.uploading_dir):
+                time.sleep(0.01)
+            elapsed = time.perf_counter() - start
+            queue.stop()
+
+        stats = server.stats
+        print(f"{name:<32} {elapsed:>8.2f} {files / elapsed:>10.1f} {stats['requests']:>9} "
+              f"{stats['failed']:>7} {len(stats['connections']):>12}")
+    finally:
+        server.shutdown()
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark result uploads against a local WebDAV stand-in")
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds the stand-in adds to every request")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of requests answered with 503")
+    args = parser.parse_args()
+
+    # No proxy for the local stand-in
+    os.environ["NO_PROXY"] = "127.0.0.1"
+
+    print(f"{args.files} files, {args.latency * 1000:.0f} ms latency, {args.fail_rate:.0%} failed requests\n")
+    print(f"{'Case':<32} {'seconds':>8} {'uploads/s':>10} {'requests':>9} {'failed':>7} {'connections':>12}")
+    run_case("baseline (new connection)", args.files, args.latency, args.fail_rate, baseline_upload)
+    for workers in (1, 2, 4):
+        run_case(f"pooled keep-alive, {workers} parallel", args.files, args.latency, args.fail_rate,
+                 lambda url, w=workers: pooled_upload(url, w), workers=workers)
+    run_case("pooled keep-alive, batches of 10", args.files, args.latency, args.fail_rate,
+             lambda url: pooled_upload(url, 1), batch_size=10)
@@ -0,0 +1,168 @@
+"""
+Local stand-in for the Sciebo WebDAV server, for testing and benchmarking uploads offline.
+
+Supports PUT, GET, MKCOL and DELETE (plus a minimal PROPFIND) on files kept in memory,
+with optional Basic auth, artificial latency and a share of requests that fail with
+503, to exercise the retry path of the upload queue.
+
+    python webdav_standin.py --port 8090 --latency 0.05 --fail-rate 0.1
+    SCIEBO_URL=http://127.0.0.1:8090 python main.py
+"""
+import argparse
+import base64
+import posixpath
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real server
+
+    def log_message(self, format, *args):
+        pass
+
+    def _path(self):
+        return posixpath.normpath(unquote(urlparse(self.path).path)).strip("/")
+
+    def _reply(self, status, body=b"", content_type="text/plain"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _check(self):
+        """Authentication, latency and injected failures; returns False if the request was answered"""
+        server = self.server
+        with server.lock:
+            server.stats["requests"] += 1
+            server.stats["connections"].add(self.client_address)
+
+        if server.credentials and self.headers.get("Authorization") != f"Basic {server.credentials}":
+            self._read_body()
+            self._reply(401)
+            return False
+        if server.latency:
+            time.sleep(server.latency)
+        if server.fail_rate and random.random() < server.fail_rate:
+            self._read_body()
+            with server.lock:
+                server.stats["failed"] += 1
+            self._reply(503, b"injected failure")
+            return False
+        return True
+
+    def do_PUT(self):
+        if not self._check():
+            return
+        path = self._path()
+        data = self._read_body()
+        with self.server.lock:
+            parent = posixpath.dirname(path)
+            if parent and parent not in self.server.dirs:
+                self._reply(409, b"parent collection missing")
+                return
+            created = path not in self.server.files
+            self.server.files[path] = data
+            self.server.stats["uploads"] += 1
+        self._reply(201 if created else 204)
+
+    def do_GET(self):
+        if not self._check():
+            return
+        with self.server.lock:
+            data = self.server.files.get(self._path())
+        if data is None:
+            self._reply(404)
+        else:
+            self._reply(200, data, "application/octet-stream")
+
+    def do_MKCOL(self):
+        if not self._check():
+            return
+        path = self._path()
+        with self.server.lock:
+            if path in self.server.dirs:
+                self._reply(405)
+                return
+            parent = posixpath.dirname(path)
+            if parent and parent not in self.server.dirs:
+                self._reply(409)
+                return
+            self.server.dirs.add(path)
+        self._reply(201)
+
+    def do_DELETE(self):
+        if not self._check():
+            return
+        with self.server.lock:
+            found = self.server.files.pop(self._path(), None) is not None
+        self._reply(204 if found else 404)
+
+    def do_PROPFIND(self):
+        if not self._check():
+            return
+        self._read_body()
+        path = self._path()
+        with self.server.lock:
+            exists = path == "." or path in self.server.dirs or path in self.server.files
+        if not exists:
+            self._reply(404)
+            return
+        body = (
+            '<?xml version="1.0" encoding="utf-8"?><d:multistatus xmlns:d="DAV:"><d:response>'
+            f'<d:href>/{path}</d:href><d:propstat><d:prop/><d:status>HTTP/1.1 200 OK</d:status>'
+            '</d:propstat></d:response></d:multistatus>'
+        ).encode("utf-8")
+        self._reply(207, body, "application/xml")
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, login=None, password=None, latency=0, fail_rate=0):
+        super().__init__(address, StandInHandler)
+        self.credentials = base64.b64encode(f"{login}:{password}".encode()).decode() if login else None
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.files = {}
+        self.dirs = set()
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "uploads": 0, "failed": 0, "connections": set()}
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_standin(port=0, **kwargs):
+    """Start a stand-in server on a background thread; returns the server (server.url, server.files, ...)"""
+    server = StandInServer(("127.0.0.1", port), **kwargs)
+    threading.Thread(target=server.serve_forever, name="webdav-standin", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in WebDAV server")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--login")
+    parser.add_argument("--password")
+    parser.add_argument("--latency", type=float, default=0, help="seconds added to every request")
+    parser.add_argument("--fail-rate", type=float, default=0, help="share of requests answered with 503")
+    args = parser.parse_args()
+
+    server = StandInServer(("127.0.0.1", args.port), args.login, args.password, args.latency, args.fail_rate)
+    print(f"WebDAV stand-in listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,77 @@
+"""
+Thread-safe WebDAV uploader with persistent HTTP connections.
+
+Each thread keeps its own requests.Session, so the TLS handshake and authentication to
+the WebDAV server are paid once per thread instead of once per upload, and a semaphore
+caps the number of uploads in flight. A file is uploaded with a single PUT; the parent
+collection is only created (MKCOL) when the server answers 409 Conflict.
+"""
+import posixpath
+import threading
+from urllib.parse import quote
+
+import requests
+
+
+class WebDAVError(Exception):
+    def __init__(self, method, url, status_code):
+        super().__init__(f"{method} {url} failed with HTTP {status_code}")
+        self.status_code = status_code
+
+
+class WebDAVUploader:
+    def __init__(self, hostname, login=None, password=None, max_parallel=4,
+                 connect_timeout=10, read_timeout=30):
+        self.base_url = hostname.rstrip("/")
+        self.auth = (login, password) if login and password else None
+        self.timeout = (connect_timeout, read_timeout)
+        self.slots = threading.BoundedSemaphore(max_parallel)
+        self.local = threading.local()
+        self.created_dirs = set()
+
+    def _session(self):
+        """HTTP session of the current thread (kept alive between uploads)"""
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.auth = self.auth
+            self.local.session = session
+        return session
+
+    def _url(self, remote_path):
+        return f"{self.base_url}/{quote(remote_path.lstrip('/'))}"
+
+    def _request(self, method, remote_path, **kwargs):
+        url = self._url(remote_path)
+        response = self._session().request(method, url, timeout=self.timeout, **kwargs)
+        # Read the body so the connection goes back to the pool
+        response.content
+        return response
+
+    def mkdirs(self, remote_dir):
+        """Create a collection and its missing parents"""
+        remote_dir = remote_dir.strip("/")
+        if not remote_dir or remote_dir in self.created_dirs:
+            return
+        self.mkdirs(posixpath.dirname(remote_dir))
+
+        response = self._request("MKCOL", remote_dir + "/")
+        # 405 Method Not Allowed: the collection already exists
+        if response.status_code >= 400 and response.status_code != 405:
+            raise WebDAVError("MKCOL", self._url(remote_dir), response.status_code)
+        self.created_dirs.add(remote_dir)
+
+    def upload_file(self, remote_path, local_path):
+        """Upload a local file to remote_path (overwrites an existing file)"""
+        with self.slots:
+            with open(local_path, "rb") as f:
+                response = self._request("PUT", remote_path, data=f)
+
+            if response.status_code == 409:
+                # Parent collection does not exist yet
+                self.mkdirs(posixpath.dirname(remote_path))
+                with open(local_path, "rb") as f:
+                    response = self._request("PUT", remote_path, data=f)
+
+            if response.status_code >= 400:
+                raise WebDAVError("PUT", self._url(remote_path), response.status_code)